@@ -1,20 +1,33 @@
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pymacaron_async import asynctask
 from pymacaron_core.swagger.apipool import ApiPool
 from pymacaron.config import get_config
 from bdl.exceptions import IndexNotSupportedError
-from bdl.db.item import get_item
+from bdl.db.item import get_item, load_item
+from bdl.db.views import get_view_counter
+from bdl.db.item import NativeUrlResolver, set_native_url_resolver
 from bdl.model.scrapedobject import model_to_scraped_object
+from bdl.model.bdlitem import model_to_bdlitem
+from bdl.io.comprehend import LanguageResolver, set_language_resolver
+from bdl.language import identify_language_locally
 from bdl.db.elasticsearch import es_search_index
-from bdl.db.elasticsearch import get_all_docs
+from bdl.db.elasticsearch import get_all_docs, get_filter_clauses
+from bdl.db.elasticsearch import ESBulkIndexer, set_bulk_indexer
 from bdl.io.slack import do_slack
-from bdl.exceptions import InvalidDataError
+from bdl.exceptions import InvalidDataError, InternalServerError
 from bdl.api.search import doc_to_item
 
 
 log = logging.getLogger(__name__)
 
 
+# Default number of scraped objects processed in parallel, if
+# process_concurrency is not set in the config
+PROCESS_CONCURRENCY = 4
+
+
 def do_process_items(data):
     """Take a list of scraped objects and decide whether to index them or not, or
     queue up tasks to re-scrape them more thoroughly, or update pre-existing
@@ -56,42 +69,117 @@ def async_process_items(index, source, real, *jsons):
 
 
 def process_items(index, source, real, *jsons):
+    """Process a batch of scraped objects with a pool of threads, and return
+    their results in the same order as the objects. Objects with the same
+    native_url are processed one after the other, in the order of the batch.
+    """
 
-    results = ApiPool.api.model.ProcessResults(results=[])
+    concurrency = getattr(get_config(), 'process_concurrency', None)
+    if not concurrency:
+        concurrency = PROCESS_CONCURRENCY
+
+    # Group objects by native_url, keeping track of their positions
+    groups = OrderedDict()
+    for i, j in enumerate(jsons):
+        groups.setdefault(j.get('native_url'), []).append(i)
+
+    results = [None] * len(jsons)
+
+    # Lookup in one go the items of all objects that will need it: ended and
+    # complete announces
+    resolver = NativeUrlResolver(concurrency=concurrency)
+    resolver.prefetch([
+        j.get('native_url') for j in jsons
+        if j.get('is_complete') or (j.get('bdlitem') or {}).get('has_ended')
+    ])
+
+    # Identify in one go, with batched calls to comprehend, the languages of
+    # the announces that will be curated and cannot be identified offline
+    languages = LanguageResolver()
+    languages.prefetch(get_unidentified_texts(jsons))
+
+    # Index and archive the whole batch of items via elasticsearch's _bulk
+    # api. Test items must be searchable as soon as they are processed, while
+    # real ones can wait for the next periodic refresh set in the config
+    refresh = None if real else 'true'
+    with ESBulkIndexer(refresh=refresh) as bulk:
+
+        def process_group(positions):
+            # The bulk indexer and resolvers are set per thread
+            set_bulk_indexer(bulk)
+            set_native_url_resolver(resolver)
+            set_language_resolver(languages)
+            try:
+                for i in positions:
+                    results[i] = process_item(index, source, real, jsons[i])
+            finally:
+                set_bulk_indexer(None)
+                set_native_url_resolver(None)
+                set_language_resolver(None)
+
+        log.info("Processing %s scraped objects with %s threads" % (len(jsons), concurrency))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(process_group, positions) for positions in groups.values()]
+            for f in futures:
+                # Re-raise any exception caught while processing
+                f.result()
+
+    # Those items are stored but not searchable: fail as indexing a single
+    # item does, instead of reporting them as processed
+    if bulk.errors:
+        raise InternalServerError("Failed to index items %s. Ksting admins are informed." % ', '.join(sorted(bulk.errors.keys())))
+
+    return ApiPool.api.model.ProcessResults(results=results)
+
+
+def get_unidentified_texts(jsons):
+    """Return the texts of the announces in those scraped objects that have no
+    language yet, and whose language cannot be identified offline"""
+    texts = []
     for j in jsons:
+        b = j.get('bdlitem')
+        if not b or b.get('has_ended') or b.get('language'):
+            continue
+        o = ApiPool.api.json_to_model('ScrapedBDLItem', b)
+        model_to_bdlitem(o)
+        text = o.get_text()
+        if not identify_language_locally(text):
+            texts.append(text)
+    return texts
 
-        o = ApiPool.api.json_to_model('ScrapedObject', j)
-        model_to_scraped_object(o)
 
-        log.info('Looking at scraped object %s' % str(o.native_url))
+def process_item(index, source, real, j):
+    """Process one scraped object and return its ProcessResult"""
 
-        action, item_id = o.process(
-            index=index,
-            source=source,
-            real=real,
-        )
+    o = ApiPool.api.json_to_model('ScrapedObject', j)
+    model_to_scraped_object(o)
 
-        do_slack(
-            "Process: doing %s on item %s (%s)" % (action, item_id, o.native_url),
-            channel=get_config().slack_api_channel,
-        )
+    log.info('Looking at scraped object %s' % str(o.native_url))
 
-        results.results.append(
-            ApiPool.api.model.ProcessResult(
-                action=action,
-                item_id=item_id,
-            )
-        )
+    action, item_id = o.process(
+        index=index,
+        source=source,
+        real=real,
+    )
+
+    do_slack(
+        "Process: doing %s on item %s (%s)" % (action, item_id, o.native_url),
+        channel=get_config().slack_api_channel,
+    )
 
-    return results
+    return ApiPool.api.model.ProcessResult(
+        action=action,
+        item_id=item_id,
+    )
 
 
 def do_get_item(item_id):
     """Get one item given its ID, from the active index or the archive"""
 
     item = get_item(item_id)
-    item.count_views = item.count_views + 1
-    item.save_to_db(async=True)
+
+    # Views are aggregated and stored in batches
+    get_view_counter().add(item)
 
     return item
 
@@ -101,7 +189,8 @@ def do_archive_item(data, item_id=None):
 
     assert data.reason == 'SOLD', "Archiving reason is %s" % data.reason
 
-    item = get_item(item_id)
+    # Not from the item cache: the item is modified and written back
+    item = load_item(item_id)
 
     assert item.index == 'BDL'
     item.get_subitem().mark_as_ended(
@@ -144,9 +233,9 @@ def rescrape_items_async(source, percentage):
         index_name='bdlitems-live',
         doc_type='BDL_ITEM',
         sort=[],
-        query='SOURCE_%s' % source.upper(),
+        filters={'source': source.upper()},
         page=0,
-        item_per_page=1,
+        item_per_page=0,
     )
 
     total_hits = res['hits']['total']
@@ -162,11 +251,8 @@ def rescrape_items_async(source, percentage):
             {"epoch_last_check": 'asc'}
         ],
         "query": {
-            "match": {
-                "free_search": {
-                    "query": "SOURCE_%s" % source,
-                    "operator": "and"
-                }
+            "bool": {
+                "filter": get_filter_clauses({'source': source.upper()}),
             }
         }
     }
@@ -1,7 +1,12 @@
 import logging
+import re
+import json
+import base64
+import datetime
+import dateutil.parser
 from urllib.parse import quote_plus
 from pymacaron_core.swagger.apipool import ApiPool
-from bdl.exceptions import InternalServerError
+from bdl.exceptions import InternalServerError, InvalidDataError
 from bdl.exceptions import ESItemNotFoundError
 from bdl.model.item import model_to_item
 from bdl.db.elasticsearch import es_search_index
@@ -10,12 +15,78 @@ from bdl.db.elasticsearch import es_search_index
 log = logging.getLogger(__name__)
 
 
+# Dates as we index them: '2018-10-01T12:00:00.123456+00:00'
+ES_DATE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?(?:\+00:00|Z)?$')
+
+def parse_es_date(s):
+    """Parse a date from an elasticsearch document, fast if it is in the
+    format we index dates in"""
+    m = ES_DATE.match(s)
+    if not m:
+        return dateutil.parser.parse(s)
+    year, month, day, hour, minute, second, micro = m.groups()
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(micro.ljust(6, '0')) if micro else 0,
+        tzinfo=datetime.timezone.utc,
+    )
+
+
+# model name -> {property: 'date', 'model:<name>' or None}
+model_properties = {}
+
+def get_model_properties(model_name):
+    """Return which properties of this model need converting from json, or
+    None if the model is not a plain object with properties (composed with
+    allOf or $ref, or without properties like TopModel)"""
+    if model_name not in model_properties:
+        definition = ApiPool.api.api_spec.swagger_dict['definitions'][model_name]
+        props = None
+        if definition.get('properties', {}) and 'allOf' not in definition and '$ref' not in definition:
+            props = {}
+            for k, v in definition.get('properties', {}).items():
+                if '$ref' in v:
+                    props[k] = 'model:%s' % v['$ref'].split('/')[-1]
+                elif v.get('format') == 'date-time':
+                    props[k] = 'date'
+                else:
+                    props[k] = None
+        model_properties[model_name] = props
+    return model_properties[model_name]
+
+
+def trusted_json_to_model(model_name, j):
+    """A lean json_to_model() for json we generated ourselves, like the
+    documents we index in elasticsearch: it skips validation, ignores
+    attributes the model does not have, and only converts dates and nested
+    models. Models of other shapes go through json_to_model()"""
+    props = get_model_properties(model_name)
+    if props is None:
+        return ApiPool.api.json_to_model(model_name, j)
+    kwargs = {}
+    for k, v in j.items():
+        if k not in props or v is None:
+            continue
+        kind = props[k]
+        if kind == 'date':
+            v = parse_es_date(v)
+        elif kind:
+            v = trusted_json_to_model(kind[len('model:'):], v)
+        kwargs[k] = v
+    return getattr(ApiPool.api.model, model_name)(**kwargs)
+
+
 def doc_to_item(doc):
-    item = ApiPool.api.json_to_model('Item', doc['_source'])
+    item = trusted_json_to_model('Item', doc['_source'])
     model_to_item(item)
     return item
 
 
+def get_item_source_fields():
+    """Return the attributes of indexed documents that make up an Item"""
+    return sorted(get_model_properties('Item').keys())
+
+
 def do_search_latest_item(source=None):
     """Query the elasticsearch index for the given source and retrieve the newest item or None"""
     assert source
@@ -26,9 +97,10 @@ def do_search_latest_item(source=None):
         sort=[
             {'date_created': {'order': 'desc'}},
         ],
-        query='SOURCE_%s' % source.upper(),
+        filters={'source': source.upper()},
         page=0,
         item_per_page=1,
+        source=get_item_source_fields(),
     )
 
     if 'hits' in res and len(res['hits']['hits']):
@@ -38,7 +110,36 @@ def do_search_latest_item(source=None):
     raise ESItemNotFoundError('Found no items from source %s' % source)
 
 
-def do_search_items(query=None, page=0, page_size=None, real=None, location=None, index=None):
+# The order of search results: newest first, and by item id between items
+# created at the same time, so hits can be paginated with search_after. The
+# keyword subfield of uid is mapped by ITEM_TEMPLATE
+SEARCH_SORT = [
+    {'date_created': {'order': 'desc'}},
+    {'count_views': {'order': 'desc'}},
+    {'display_priority': {'order': 'desc'}},
+    {'uid.keyword': {'order': 'desc'}},
+]
+
+
+def encode_cursor(hit):
+    """Return an opaque cursor pointing after this search hit"""
+    s = json.dumps(hit['sort'], separators=(',', ':'))
+    return base64.urlsafe_b64encode(s.encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the sort values of the hit a cursor points after"""
+    try:
+        s = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf8')
+        values = json.loads(s)
+    except Exception:
+        raise InvalidDataError("Invalid search cursor: %s" % cursor)
+    if type(values) is not list or len(values) != len(SEARCH_SORT):
+        raise InvalidDataError("Invalid search cursor: %s" % cursor)
+    return values
+
+
+def do_search_items(query=None, page=0, page_size=None, real=None, location=None, index=None, cursor=None):
 
     if real not in (True, False):
         real = True
@@ -74,30 +175,27 @@ def do_search_items(query=None, page=0, page_size=None, real=None, location=None
     res = es_search_index(
         index_name=index_name,
         doc_type='BDL_ITEM',
-        sort=[
-            {'date_created': {'order': 'desc'}},
-            {'count_views': {'order': 'desc'}},
-            {'display_priority': {'order': 'desc'}},
-        ],
+        sort=SEARCH_SORT,
         query=internal_query,
         page=page,
         item_per_page=page_size,
+        source=get_item_source_fields(),
+        search_after=decode_cursor(cursor) if cursor else None,
     )
 
     count_found = res['hits']['total']
-    items = []
-    for doc in res['hits']['hits']:
-        import json
-        log.debug("Looking at item: %s" % json.dumps(doc['_source'], indent=4))
-        items.append(doc_to_item(doc))
-
-    # Query urls for the current and next page
-    def gen_url(page):
-        url = '/v1/search?page=%s&page_size=%s' % (
+    hits = res['hits']['hits']
+    items = [doc_to_item(doc) for doc in hits]
 
+    # Query urls for the current and next page. The cursor lets the next page
+    # be fetched with search_after, however deep it is
+    def gen_url(page, cursor=None):
+        url = '/v1/search?page=%s&page_size=%s' % (
             int(page),
             int(page_size),
         )
+        if cursor:
+            url = url + '&cursor=%s' % cursor
         if query:
             url = url + '&query=%s' % quote_plus(query.encode('utf8'))
         if location:
@@ -111,11 +209,11 @@ def do_search_items(query=None, page=0, page_size=None, real=None, location=None
         query=query,
         location=location,
         count_found=count_found,
-        url_this=gen_url(page),
+        url_this=gen_url(page, cursor),
         items=items,
     )
 
-    if count_found > (page + 1) * page_size:
-        results.url_next = gen_url(page + 1)
+    if hits and count_found > (page + 1) * page_size:
+        results.url_next = gen_url(page + 1, encode_cursor(hits[-1]))
 
     return results
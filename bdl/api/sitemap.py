@@ -1,19 +1,23 @@
 import logging
+import gzip
 import urllib.request
 import urllib.parse
-from datetime import datetime, timedelta
+import json
+from datetime import datetime, timezone
 import requests
 import re
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
 from boto.s3.key import Key
 from unidecode import unidecode
 from pymacaron_async import asynctask
-from pymacaron.utils import timenow
+from pymacaron.utils import timenow, to_epoch
 from pymacaron_core.swagger.apipool import ApiPool
 from bdl.utils import html_to_unicode
-from bdl.io.s3 import get_s3_conn
+from bdl.io.s3 import get_s3_conn, S3UploadStream
 from bdl.io.slack import do_slack
-from bdl.api.search import doc_to_item
 from bdl.db.elasticsearch import get_all_docs
 from pymacaron.config import get_config
 
@@ -25,96 +29,112 @@ log = logging.getLogger(__name__)
 # Utils for generating sitemaps
 #
 
-def compile_sitemap(urls):
-
-    if len(urls) == 0:
-        return ''
+class SitemapWriter():
+    """Write a sitemap, or a sitemap index if index is True, one url at a time
+    into the binary file-like object f, so that sitemaps of any size are
+    generated in constant memory"""
+
+    def __init__(self, f, index=False):
+        self.f = f
+        self.index = index
+        self.count = 0
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        if index:
+            self.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        else:
+            self.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">\n')
 
-    log.info("Generating sitemap with %s urls" % len(urls))
+    def write(self, s):
+        self.f.write(s.encode('utf8'))
 
-    elems = ''
+    def add(self, url):
+        """Add a url, either as a string or as a dict with the key 'url' and
+        optionally 'lastmod', 'priority', 'changefreq' and the url of the
+        page in other languages under the language's code"""
 
-    for url in urls:
-        if type(url) is dict:
+        if type(url) is not dict:
+            url = {'url': url}
 
-            if 'priority' not in url:
-                url['priority'] = '0.8'
+        tag = 'sitemap' if self.index else 'url'
+        l = [
+            '  <%s>\n' % tag,
+            '    <loc>%s</loc>\n' % escape(url['url']),
+        ]
 
-            s = (
-                '  <url>\n'
-                '    <loc>' + url['url'] + '</loc>\n'
-                '    <priority>' + url['priority'] + '</priority>\n'
-            )
+        if not self.index:
+            l.append('    <priority>%s</priority>\n' % escape(url.get('priority', '0.8')))
 
-            if 'lastmod' in url:
-                s = s + '    <lastmod>' + url['lastmod'] + '</lastmod>\n'
+        if 'lastmod' in url:
+            l.append('    <lastmod>%s</lastmod>\n' % escape(url['lastmod']))
 
+        if not self.index:
             if 'changefreq' in url:
-                s = s + '    <changefreq>' + url['changefreq'] + '</changefreq>\n'
-
-            for l in ('en', 'sv'):
-                if l in list(url.keys()):
-                    log.info("hreflang for %s is %s" % (l, url[l]))
-                    s = s + '    <xhtml:link rel="alternate" hreflang="' + l + '" href="' + url[l] + '" />\n'
-
-            s = s + '  </url>\n'
-
-        else:
-            s = (
-                '  <url>\n'
-                '    <loc>' + url + '</loc>\n'
-                '    <priority>0.8</priority>\n'
-                '  </url>\n'
-            )
+                l.append('    <changefreq>%s</changefreq>\n' % escape(url['changefreq']))
 
-        elems = elems + s
+            for language in ('en', 'sv'):
+                if language in url:
+                    l.append('    <xhtml:link rel="alternate" hreflang="%s" href=%s />\n' % (language, quoteattr(url[language])))
 
-    return '\n'.join([
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">',
-        elems,
-        '</urlset>',
-    ])
+        l.append('  </%s>\n' % tag)
 
+        self.write(''.join(l))
+        self.count = self.count + 1
 
-def compile_sitemap_index(urls):
+    def close(self):
+        self.write('</sitemapindex>\n' if self.index else '</urlset>\n')
 
-    log.info("Generating a sitemap index with %s urls" % len(urls))
 
-    elems = ''
+@contextmanager
+def open_sitemap(key_name, index=False):
+    """Return a SitemapWriter streaming into the key key_name of the static
+    bucket, gzip-compressed if key_name ends with '.gz'. The sitemap is
+    uploaded when leaving the context, unless it is empty or an exception
+    was raised"""
 
-    for url in urls:
-        if type(url) is dict:
-            s = (
-                '  <sitemap>\n'
-                '    <loc>' + url['url'] + '</loc>\n'
-            )
-            if 'lastmod' in url:
-                s = s + '    <lastmod>' + url['lastmod'] + '</lastmod>\n'
-            s = s + '  </sitemap>\n'
-
-        else:
-            s = (
-                '  <sitemap>\n'
-                '    <loc>' + url + '</loc>\n'
-                '  </sitemap>\n'
-            )
-
-        elems = elems + s
+    gzipped = key_name.endswith('.gz')
+    stream = S3UploadStream(
+        'static.bazardelux.com',
+        key_name,
+        content_type='application/x-gzip' if gzipped else 'application/xml',
+    )
+    f = gzip.GzipFile(fileobj=stream, mode='wb') if gzipped else stream
+
+    try:
+        smap = SitemapWriter(f, index=index)
+        yield smap
+        smap.close()
+        if gzipped:
+            f.close()
+    except BaseException:
+        stream.abort()
+        raise
+
+    if smap.count == 0:
+        log.info("NOT uploading sitemap %s: it's empty..." % (key_name))
+        stream.abort()
+        return
 
-    return '\n'.join([
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
-        elems,
-        '</sitemapindex>',
-    ])
+    log.info("Uploading sitemap %s with %s urls" % (key_name, smap.count))
+    stream.close()
 
 
 #
 # Generating monthly sitemaps
 #
 
-def set_item_url(item):
+# Attributes of indexed items needed to generate their urls
+ITEM_URL_FIELDS = [
+    'item_id',
+    'date_created',
+    'epoch_created',
+    'bdlitem.title',
+    'bdlitem.price',
+    'bdlitem.currency',
+    'bdlitem.language',
+]
+
+
+def get_item_url(item_id, title, price, currency, language):
 
     # NOTE: make sure to keep in synch with the same dict in bdl-com/www/translations.json
     URL_FORSALE_LABEL = {
@@ -123,139 +143,315 @@ def set_item_url(item):
         "fr": "avendre",
     }
 
-    s = unidecode(html_to_unicode(item.bdlitem.title))
+    s = unidecode(html_to_unicode(title))
     s = re.sub('[^0-9a-zA-Z]+', '-', s)
     s = re.sub('[-]+', '-', s)
     s = s.strip('-')
-    s = '%s_%s_%s__%s' % (s, item.bdlitem.price, item.bdlitem.currency, item.item_id)
-    language = item.bdlitem.language
+    s = '%s_%s_%s__%s' % (s, price, currency, item_id)
     forsale = URL_FORSALE_LABEL.get(language) if language in URL_FORSALE_LABEL else URL_FORSALE_LABEL['en']
-    item.url = 'https://bazardelux.com/%s/%s/%s' % (language, forsale, s)
+    return 'https://bazardelux.com/%s/%s/%s' % (language, forsale, s)
+
+
+def get_month_epochs(year, month):
+    """Return the epochs of the beginning of this month and of the next one"""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc) if month == 12 else datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return to_epoch(start), to_epoch(end)
+
+
+def get_items_forsale_for_period(year, month, since=None):
+    """Yield the urls of all items created during this year-month period, or
+    only of those created after the epoch since, if set, as dicts with the
+    keys 'item_id', 'url', 'date_created' and 'epoch_created'. Documents are
+    fetched with only the attributes needed for that, in index order, and
+    are not converted into Items"""
+
+    start, end = get_month_epochs(year, month)
+    if since and since > start:
+        start = since
+
+    log.info("About to list all items created between epochs %s and %s" % (start, end))
+
+    index_name = 'bdlitems-live'
+    doc_type = 'BDL_ITEM'
+    batch_size = 100
+    esquery = {
+        "size": batch_size,
+        "_source": ITEM_URL_FIELDS,
+        "sort": ["_doc"],
+        "query": {
+            "range": {
+                "epoch_created": {
+                    "gte": start,
+                    "lt": end,
+                }
+            }
+        }
+    }
 
+    for doc in get_all_docs(esquery, index_name, doc_type, batch_size):
+        j = doc['_source']
+        bdlitem = j['bdlitem']
+        yield {
+            'item_id': j['item_id'],
+            'url': get_item_url(j['item_id'], bdlitem['title'], bdlitem['price'], bdlitem['currency'], bdlitem.get('language')),
+            'date_created': j['date_created'],
+            'epoch_created': j['epoch_created'],
+        }
 
-def get_items_forsale_for_period(year, month):
 
-    log.info("About to list all items under period %s-%s" % (year, month))
+# A sitemap may not contain more than 50000 urls: the announces of a month
+# are split into shards of that size
+SITEMAP_MAX_URLS = 50000
 
-    for create_date in get_dates_in_month(year, month):
+# Default number of shards written in parallel, if sitemap_concurrency is not
+# set in the config
+SITEMAP_CONCURRENCY = 4
 
-        log.info("Fetching items published on %s" % create_date)
 
-        index_name = 'bdlitems-live'
-        doc_type = 'BDL_ITEM'
-        batch_size = 100
-        esquery = {
-            "size": batch_size,
-            "query": {
-                "match": {
-                    "date_created": create_date
-                }
+def get_sitemap_name(year, month, shard=None):
+    """Return the name of the sitemap of announces for this year-month period,
+    or of its shard-th shard (starting at 1), gzip-compressed if sitemap_gzip
+    is set in the config"""
+    name = 'sitemap-bazardelux-%04d-%02d' % (year, month)
+    if shard:
+        name = '%s-%s' % (name, shard)
+    name = name + '.xml'
+    if getattr(get_config(), 'sitemap_gzip', None):
+        name = name + '.gz'
+    return name
+
+
+def get_shards(entries):
+    """Split the item ids of a manifest into lists of at most SITEMAP_MAX_URLS
+    ids, oldest items first, so that new announces go into the last shard
+    and leave the others unchanged"""
+    item_ids = sorted(entries.keys(), key=lambda item_id: (entries[item_id]['epoch'], item_id))
+    return [item_ids[i:i + SITEMAP_MAX_URLS] for i in range(0, len(item_ids), SITEMAP_MAX_URLS)]
+
+
+def generate_sitemap_shard(smap_name, item_ids, entries):
+    with open_sitemap(smap_name) as smap:
+        for item_id in item_ids:
+            entry = entries[item_id]
+            smap.add({
+                'url': entry['url'],
+                'lastmod': entry['lastmod'],
+                'priority': '0.8',
+            })
+
+
+#
+# Manifests of the urls in monthly sitemaps
+#
+
+# A manifest lists, as gzipped json lines sorted by item_id, the urls added so
+# far to the sitemap of a month, with the item's epoch_created. The newest
+# epoch tells from when to look for new items, minus this many seconds to
+# catch items indexed a while after their creation
+MANIFEST_OVERLAP = 3600
+
+
+def get_manifest_name(year, month):
+    return 'sitemap-manifest-bazardelux-%04d-%02d.jsonl.gz' % (year, month)
+
+
+def load_manifest(year, month):
+    """Return the manifest of this month's sitemap, as a dict of item_id ->
+    {'url', 'lastmod', 'epoch'}"""
+    entries = {}
+    s = get_sitemap_urls(get_manifest_name(year, month))
+    for line in s.splitlines():
+        if line:
+            entry = json.loads(line)
+            entries[entry.pop('item_id')] = entry
+    return entries
+
+
+def load_manifest_from_sitemap(key_name):
+    """Build a manifest from a sitemap generated before manifests existed"""
+    entries = {}
+    smap = get_sitemap_urls(key_name)
+    if not smap:
+        return entries
+
+    root = ET.fromstring(smap)
+    for url_data in list(root):
+        url, date = None, None
+        for e in list(url_data):
+            if str(e.tag).endswith('loc'):
+                url = e.text
+            elif str(e.tag).endswith('lastmod'):
+                date = e.text
+        if url:
+            m = re.search(r'__([^/_]+)$', url)
+            entries[m.group(1) if m else url] = {
+                'url': url,
+                'lastmod': date,
+                'epoch': to_epoch(date[0:10] + 'T00:00:00') if date else 0,
             }
-        }
+    return entries
+
 
-        for doc in get_all_docs(esquery, index_name, doc_type, batch_size):
-            i = doc_to_item(doc)
-            set_item_url(i)
-            yield i
+def save_manifest(year, month, entries):
+    """Upload the manifest of this month's sitemap"""
+    stream = S3UploadStream('static.bazardelux.com', get_manifest_name(year, month), content_type='application/x-gzip')
+    f = gzip.GzipFile(fileobj=stream, mode='wb')
+    for item_id in sorted(entries.keys()):
+        line = json.dumps(dict(entries[item_id], item_id=item_id), sort_keys=True, separators=(',', ':'))
+        f.write(line.encode('utf8') + b'\n')
+    f.close()
+    stream.close()
 
 
 def generate_sitemap_announces(year, month):
-    """Generate the endprice sitemap for the given year-month
-    period and upload it to S3"""
-
-    # Name of that partial sitemap
-    smap_name = 'sitemap-bazardelux-%04d-%02d.xml' % (year, month)
-
-    # We use a dict to filter out duplicates
-    urls = {}
-
-    def add_url(url, date_created):
-        # Add one url to the the urls dict
-        log.debug("Adding (%s) (%s)" % (date_created, url))
-        urls[url] = {
-            'url': url,
-            'lastmod': str(date_created)[0:10],
-            'priority': '0.8',
-        }
+    """Generate the endprice sitemaps for the given year-month
+    period and upload them to S3, one shard per SITEMAP_MAX_URLS urls.
+
+    Sitemaps are streamed into S3, but the month's manifest is held in
+    memory to sort and shard its urls: memory stays proportional to the
+    number of urls of the month"""
 
     # A problem we have is that from day to day, as the sitemap gets
     # recompiled, announces that have been sold will have been removed from the
     # ES index and therefore disappear from the sitemap. We could scan the
     # dynamodb archive, but that would be awfully slow. So instead, we keep all
-    # urls indexed so far that month and only add to that list. That means
-    # we'll loose a few announces: those that got added, then sold the same
-    # day. But it's okay.
-
-    # First, fetch the sitemap for this year and month, if it exists, and load it into urls
-    smap = get_sitemap_urls(smap_name)
-    if smap:
-        # Extract all urls from that sitemap
-        log.debug("Loading: %s" % smap[0:500])
-        root = ET.fromstring(smap)
-        for url_data in list(root):
-            url, date = None, None
-            for e in list(url_data):
-                if str(e.tag).endswith('loc'):
-                    # It's the url
-                    url = e.text
-                elif str(e.tag).endswith('lastmod'):
-                    # It's the date updated
-                    date = e.text
-            if url:
-                add_url(url, date)
+    # urls indexed so far that month in a manifest and only add to it. That
+    # means we'll loose a few announces: those that got added, then sold
+    # before the next run. But it's okay.
+
+    entries = load_manifest(year, month)
+    legacy_name = None
+    if entries:
+        log.info("Loaded %s announces from the manifest" % len(entries))
+        old_shards = get_shards(entries)
+    else:
+        # Months generated before sharding have a single unnumbered sitemap
+        legacy_name = get_sitemap_name(year, month)
+        entries = load_manifest_from_sitemap(legacy_name)
+        log.info("Loaded %s announces from current sitemap" % len(entries))
+        old_shards = []
+
+    # Only look for items created since the newest one in the manifest
+    since = None
+    if entries:
+        since = max(e['epoch'] for e in entries.values()) - MANIFEST_OVERLAP
+
+    changed = set()
+    for item in get_items_forsale_for_period(year, month, since=since):
+        log.debug("Got item: %s" % item)
+        entry = {
+            'url': item['url'],
+            'lastmod': item['date_created'][0:10],
+            'epoch': item['epoch_created'],
+        }
+        if entries.get(item['item_id']) != entry:
+            entries[item['item_id']] = entry
+            changed.add(item['item_id'])
 
-        log.info("Loaded %s announces from current sitemap" % len(urls))
+    log.info("Listed %s announces for period %04d-%02d, %s of them new" % (len(entries), year, month, len(changed)))
 
-    # Now add all announces still in the ES index
-    for item in get_items_forsale_for_period(year, month):
-        log.info("Got item: %s" % item)
-        if not item:
-            continue
+    # Only rewrite the shards whose urls changed
+    shards = {}
+    names = []
+    for i, item_ids in enumerate(get_shards(entries)):
+        name = get_sitemap_name(year, month, shard=i + 1)
+        names.append(name)
+        if i >= len(old_shards) or old_shards[i] != item_ids or changed.intersection(item_ids):
+            shards[name] = item_ids
 
-        if len(urls) > 50000:
-            # A sitemap may not contain more than 50000 entries...
-            break
+    if not shards:
+        log.info("Sitemaps of period %04d-%02d are up to date" % (year, month))
+        # In case a previous run failed to list them in the sitemap index
+        update_sitemap_index(listed=names)
+        return len(entries)
 
-        add_url(item.url, item.date_created)
+    concurrency = getattr(get_config(), 'sitemap_concurrency', None) or SITEMAP_CONCURRENCY
+    log.info("Generating sitemaps %s with %s threads" % (', '.join(sorted(shards.keys())), concurrency))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(generate_sitemap_shard, smap_name, item_ids, entries) for smap_name, item_ids in shards.items()]
+        for f in futures:
+            # Re-raise any exception caught while generating a shard
+            f.result()
 
-    urls = list(urls.keys())
+    deleted = []
+    if legacy_name and entries:
+        deleted.append(legacy_name)
 
-    log.info("Listed %s announces for period %04d-%02d" % (len(urls), year, month))
+    update_sitemap_index(written=list(shards.keys()), deleted=deleted, listed=names)
 
-    smap = compile_sitemap(urls)
+    for name in deleted:
+        log.info("Deleting sitemap %s, replaced by its shards" % name)
+        get_s3_conn().get_bucket('static.bazardelux.com').delete_key(name)
 
-    upload_sitemap(smap, smap_name)
+    # Save the manifest once the sitemaps are written and listed in the
+    # sitemap index, so that a failed run is retried from scratch
+    save_manifest(year, month, entries)
 
-    return len(urls)
+    return len(entries)
 
 
 #
-# Utils
+# Index of all sitemaps
 #
 
-def upload_sitemap(smap, key_name):
-
-    if len(smap) == 0:
-        log.info("NOT uploading sitemap %s: it's empty..." % (key_name))
-        return
+# Name of the json dict of sitemap name -> date last written, listing all the
+# sitemaps of the site, so that the sitemap index is compiled without listing
+# the static bucket
+SITEMAP_INDEX_NAME = 'sitemap-index-bazardelux.json'
 
-    log.info("Uploading sitemap %s" % (key_name))
 
+def load_sitemap_index():
+    """Return the dict of all sitemaps and the date they were last written,
+    built from a listing of the sitemaps in the static bucket if it does
+    not exist yet"""
     bucket = get_s3_conn().get_bucket('static.bazardelux.com')
+    k = bucket.get_key(SITEMAP_INDEX_NAME)
+    if k:
+        return json.loads(k.get_contents_as_string().decode('utf8'))
+
+    log.info("Listing all sitemaps in static.bazardelux.com")
+    return {k.name: k.last_modified[0:10] for k in bucket.list(prefix='sitemap-bazardelux')}
+
+
+def update_sitemap_index(written=None, deleted=None, listed=None):
+    """Record that those sitemaps were just written, or deleted. Sitemaps in
+    listed are added to the index if missing from it. The index is uploaded
+    only if it changed"""
+    index = load_sitemap_index()
+    old_index = dict(index)
+    today = str(timenow())[0:10]
+    for name in written or []:
+        index[name] = today
+    for name in listed or []:
+        if name not in index:
+            log.info("Adding missing sitemap %s to the sitemap index" % name)
+            index[name] = today
+    for name in deleted or []:
+        index.pop(name, None)
+
+    if index == old_index:
+        return
+
+    k = Key(get_s3_conn().get_bucket('static.bazardelux.com'))
+    k.key = SITEMAP_INDEX_NAME
+    k.set_metadata('Content-Type', 'application/json')
+    k.set_contents_from_string(json.dumps(index, sort_keys=True, indent=1))
 
-    k = Key(bucket)
-    k.key = key_name
-    k.set_metadata('Content-Type', 'application/xml')
-    k.set_contents_from_string(smap)
-    k.set_acl('public-read')
 
+#
+# Utils
+#
 
 def get_sitemap_urls(key_name):
     bucket = get_s3_conn().get_bucket('static.bazardelux.com')
     k = bucket.get_key(key_name)
     if not k:
         return ''
-    return k.get_contents_as_string()
+    s = k.get_contents_as_string()
+    if key_name.endswith('.gz'):
+        s = gzip.decompress(s)
+    return s
 
 
 def ping_search_engines():
@@ -278,21 +474,6 @@ def ping_search_engines():
             raise Exception("Failed to submit new sitemap to %s because caught %s" % (ping_url, str(e)))
 
 
-def get_dates_in_month(year, month):
-
-    day_one_str = '%04d-%02d-01' % (year, month)
-    day_one = datetime.strptime(day_one_str, "%Y-%m-%d")
-    dates = [day_one_str]
-
-    for delta in range(1, 31):
-        d = day_one + timedelta(days=delta)
-        d_str = d.strftime("%Y-%m-%d")
-        if d_str.startswith('%04d-%02d' % (year, month)):
-            dates.append(d_str)
-
-    return dates
-
-
 STATIC_URLS = [
     'en', 'sv', 'fr',
     'en/about', 'sv/about', 'fr/about',
@@ -300,15 +481,14 @@ STATIC_URLS = [
 ]
 
 def generate_sitemap_static_pages():
-    urls = []
-    for url in STATIC_URLS:
-        urls.append({
-            'url': 'https://bazardelux.com/%s' % url,
-            'priority': '1.0',
-        })
-    smap = compile_sitemap(urls)
     smap_name = 'sitemap-bazardelux-pages.xml'
-    upload_sitemap(smap, smap_name)
+    with open_sitemap(smap_name) as smap:
+        for url in STATIC_URLS:
+            smap.add({
+                'url': 'https://bazardelux.com/%s' % url,
+                'priority': '1.0',
+            })
+    update_sitemap_index(written=[smap_name])
 
 #
 # API endpoint
@@ -323,19 +503,16 @@ def async_generate_sitemap():
     now = timenow()
     count = generate_sitemap_announces(now.year, now.month)
 
-    # List all sitemaps for this site
-    log.info("Listing all sitemaps in static.bazardelux.com")
+    # Compile the index of all sitemaps for this site
+    index = load_sitemap_index()
     bucket = get_s3_conn().get_bucket('static.bazardelux.com')
-    urls = []
-    for k in bucket.list():
-        if k.name.startswith("sitemap-bazardelux"):
-            urls.append('https:' + k.generate_url(expires_in=0, query_auth=False))
-
-    # Compile and upload sitemap index
-    log.info("Sitemap index contains %s sitemaps" % len(urls))
-    smap = compile_sitemap_index(urls)
-    smap_name = 'sitemap-www-https-bazardelux-com.xml'
-    upload_sitemap(smap, smap_name)
+    with open_sitemap('sitemap-www-https-bazardelux-com.xml', index=True) as smap:
+        for name in sorted(index.keys()):
+            smap.add({
+                'url': 'https:' + bucket.new_key(name).generate_url(expires_in=0, query_auth=False),
+                'lastmod': index[name],
+            })
+        log.info("Sitemap index contains %s sitemaps" % smap.count)
 
     # And ping search engines
     ping_search_engines()
@@ -1,6 +1,6 @@
 import os
 import logging
-from bdl.tagger import KeywordList
+from bdl.tagger import KeywordList, KeywordTrie
 
 
 log = logging.getLogger(__name__)
@@ -34,11 +34,9 @@ class Category:
         assert language
 
         tags = []
-        text = text.lower()
-        for w in self.whitelist.keywords:
-            if w.match(text, language):
-                log.debug("Item matches [%s] in %s whitelist" % (w, self.name))
-                tags.append(w.word.lower())
+        for w in self.whitelist.get_matching_keywords(text, language):
+            log.debug("Item matches [%s] in %s whitelist" % (w, self.name))
+            tags.append(w.word.lower())
         return tags
 
 
@@ -79,3 +77,91 @@ def get_categories():
 
 SOLD = KeywordList('%s/sold.html' % DIR_LISTS)
 BLACKLIST_ALL = KeywordList('%s/all-blacklist.html' % DIR_LISTS)
+
+
+#
+# Curation: matching an announce against all lists in one pass
+#
+
+class CurationMatches:
+    """The keywords of every curation list that match one announce's text"""
+
+    def __init__(self, matches):
+        # list name -> matching keywords, in the order of the list
+        self.matches = matches
+
+    def get_keyword(self, kwl):
+        """Return the first keyword of this list matching the text, or None"""
+        keywords = self.matches.get(kwl.name)
+        return keywords[0] if keywords else None
+
+    def match(self, kwl):
+        """Return true if the text matches a keyword of this list"""
+        return kwl.name in self.matches
+
+
+class CurationLists:
+    """All the keyword lists used to curate announces (sold, global blacklist,
+    and the black/whitelist of every category) compiled into one trie, so that
+    an announce's text is split and scanned only once to know which lists it
+    matches.
+    """
+
+    def __init__(self, lists):
+        self.trie = KeywordTrie()
+        for kwl in lists:
+            for i, w in enumerate(kwl.keywords):
+                self.trie.add(w, (kwl.name, i))
+
+    def match(self, text, language):
+        """Match this text against all lists and return a CurationMatches"""
+        assert text is not None
+        assert language
+
+        found = {}
+        for w, (name, i) in self.trie.match(text.lower().split(' '), language):
+            found.setdefault(name, []).append((i, w))
+
+        matches = {}
+        for name, l in found.items():
+            matches[name] = [w for i, w in sorted(l, key=lambda t: t[0])]
+
+        return CurationMatches(matches)
+
+
+class CurationVerdict:
+    """The outcome of curating an announce: whether it passed and in which
+    category, or else which list and keyword rejected it. Attributes:
+
+    passed:     true if the announce passes curation
+    reason:     PASSED, SOLD, BLACKLISTED or NO_CATEGORY
+    category:   name of the category the announce passed in, if any
+    list_name:  name of the keyword list that rejected the announce, if any
+    keyword:    keyword that rejected the announce, if any
+    rejections: category name -> why the announce failed in this category
+                (PRICE, BLACKLIST or WHITELIST)
+    """
+
+    def __init__(self, passed, reason, category=None, list_name=None, keyword=None, rejections=None):
+        assert reason in ('PASSED', 'SOLD', 'BLACKLISTED', 'NO_CATEGORY')
+        self.passed = passed
+        self.reason = reason
+        self.category = category
+        self.list_name = list_name
+        self.keyword = keyword
+        self.rejections = rejections if rejections else {}
+
+    def __str__(self):
+        return "<CurationVerdict %s%s%s>" % (
+            self.reason,
+            ' category=%s' % self.category if self.category else '',
+            ' list=%s keyword=%s' % (self.list_name, self.keyword) if self.list_name else '',
+        )
+
+
+CURATION_LISTS = CurationLists(
+    [SOLD, BLACKLIST_ALL] + [c.blacklist for c in CATEGORIES] + [c.whitelist for c in CATEGORIES]
+)
+
+def get_curation_lists():
+    return CURATION_LISTS
@@ -1,7 +1,10 @@
 import logging
 import re
+import threading
+import time
 from elasticsearch import exceptions
 from pymacaron.crash import report_error
+from pymacaron.config import get_config
 from pymacaron_async import asynctask
 from bdl.exceptions import ESItemNotFoundError, InternalServerError
 from bdl.io.es import get_es
@@ -20,22 +23,55 @@ def cleanup_string(s):
     s = s.strip()
     return s
 
+#
+# Refresh policies
+#
+
+# How soon writes become visible to searches:
+#   'true':     refresh the index right after the write (costly: creates a new
+#               segment for every write)
+#   'wait_for': wait for the next periodic refresh before returning
+#   'false':    return immediately and let the periodic refresh happen
+REFRESH_POLICIES = ('true', 'wait_for', 'false')
+
+def get_refresh_policy(refresh=None, setting='es_refresh'):
+    """Return the refresh policy to pass to elasticsearch. refresh may be one of
+    REFRESH_POLICIES, True or False, or None to use the policy set in the
+    config by 'setting' (immediate refresh if not set)"""
+    if refresh is None:
+        refresh = getattr(get_config(), setting, None)
+        if refresh is None:
+            refresh = 'true'
+    if refresh is True:
+        refresh = 'true'
+    elif refresh is False or refresh == 'none':
+        refresh = 'false'
+    assert refresh in REFRESH_POLICIES, "Unknown refresh policy %s" % refresh
+    return refresh
+
+
 #
 # Index document
 #
 
 
 @asynctask()
-def es_index_doc_async(index_name, doc, doc_type, uid):
-    es_index_doc(index_name, doc, doc_type, uid)
+def es_index_doc_async(index_name, doc, doc_type, uid, refresh=None):
+    es_index_doc(index_name, doc, doc_type, uid, refresh=refresh)
 
-def es_index_doc(index_name, doc, doc_type, uid):
-    """Insert the document in the given elasticsearch index"""
+def es_index_doc(index_name, doc, doc_type, uid, refresh=None):
+    """Insert the document in the given elasticsearch index. See
+    get_refresh_policy() for the values of refresh."""
 
     assert index_name
     assert doc
     assert uid
 
+    bulk = get_bulk_indexer()
+    if bulk:
+        bulk.index(index_name, doc, doc_type, uid)
+        return
+
     es = get_es()
 
     doc['uid'] = uid
@@ -49,7 +85,7 @@ def es_index_doc(index_name, doc, doc_type, uid):
             doc_type=doc_type,
             id=uid,
             body=doc,
-            refresh=True,
+            refresh=get_refresh_policy(refresh),
         )
         log.info("ES.index() returns %s" % r)
 
@@ -61,16 +97,179 @@ def es_index_doc(index_name, doc, doc_type, uid):
         raise InternalServerError("Failed to index this item. Ksting admins are informed.")
 
 
-def es_delete_doc(index_name, doc_type, uid):
+def es_delete_doc(index_name, doc_type, uid, refresh=None):
+    bulk = get_bulk_indexer()
+    if bulk:
+        bulk.delete(index_name, doc_type, uid)
+        return
+
     get_es().delete(
         index=index_name,
         doc_type=doc_type,
         id=uid,
-        refresh=True,
+        refresh=get_refresh_policy(refresh),
         ignore=[404],
     )
 
 
+@asynctask()
+def es_update_doc_async(index_name, doc, doc_type, uid, refresh=None):
+    es_update_doc(index_name, doc, doc_type, uid, refresh=refresh)
+
+def es_update_doc(index_name, doc, doc_type, uid, refresh=None):
+    """Update only the attributes in doc of this document. See
+    get_refresh_policy() for the values of refresh."""
+
+    assert index_name
+    assert doc
+    assert uid
+
+    bulk = get_bulk_indexer()
+    if bulk:
+        bulk.update(index_name, doc, doc_type, uid)
+        return
+
+    try:
+        r = get_es().update(
+            index=index_name,
+            doc_type=doc_type,
+            id=uid,
+            body={'doc': doc},
+            refresh=get_refresh_policy(refresh),
+        )
+        log.info("ES.update() returns %s" % r)
+    except Exception as e:
+        report_error("Failed to update item in Elasticsearch. Got error: %s\nindex_name=%s\nid=%s\ndoc=%s" % (str(e), index_name, uid, doc))
+        raise InternalServerError("Failed to update this item. Ksting admins are informed.")
+
+
+#
+# Bulk indexing
+#
+
+class ESBulkIndexer():
+    """Buffer index, update and delete actions and send them to elasticsearch in
+    batches, via the _bulk api. The buffer is flushed when it reaches
+    max_actions actions or max_bytes bytes, when its oldest action is more than
+    max_seconds old, and when leaving the indexer's 'with' block. The age of
+    the buffer is only checked when an action is added: there is no timer,
+    so a buffer that stops receiving actions waits for the end of the 'with'
+    block. Each flush
+    uses the refresh policy 'refresh', or the 'es_bulk_refresh' policy set in
+    the config (see get_refresh_policy()).
+
+    Every flush returns a dict of the documents that failed, as {uid: error},
+    and those errors are also collected in self.errors. Actions may be added
+    from concurrent threads.
+    """
+
+    def __init__(self, max_actions=500, max_bytes=5 * 1024 * 1024, max_seconds=5, refresh=None):
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.refresh = get_refresh_policy(refresh, setting='es_bulk_refresh')
+        self.lock = threading.RLock()
+        self.lines = []
+        self.uids = []
+        self.size = 0
+        self.first_added = None
+        self.errors = {}
+
+    def __enter__(self):
+        set_bulk_indexer(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        set_bulk_indexer(None)
+        self.flush()
+
+    def _add(self, uid, *actions):
+        serializer = get_es().transport.serializer
+        lines = [serializer.dumps(a) for a in actions]
+        with self.lock:
+            if not self.lines:
+                self.first_added = time.time()
+            self.lines.extend(lines)
+            self.uids.append(uid)
+            self.size = self.size + sum([len(l) + 1 for l in lines])
+
+            if len(self.uids) >= self.max_actions \
+               or self.size >= self.max_bytes \
+               or time.time() - self.first_added >= self.max_seconds:
+                self.flush()
+
+    def index(self, index_name, doc, doc_type, uid):
+        """Queue up the indexing of this document"""
+        assert index_name
+        assert doc
+        assert uid
+        doc['uid'] = uid
+        self._add(uid, {'index': {'_index': index_name, '_type': doc_type, '_id': uid}}, doc)
+
+    def update(self, index_name, doc, doc_type, uid):
+        """Queue up a partial update of this document"""
+        assert index_name
+        assert doc
+        assert uid
+        self._add(uid, {'update': {'_index': index_name, '_type': doc_type, '_id': uid}}, {'doc': doc})
+
+    def delete(self, index_name, doc_type, uid):
+        """Queue up the removal of this document"""
+        assert index_name
+        assert uid
+        self._add(uid, {'delete': {'_index': index_name, '_type': doc_type, '_id': uid}})
+
+    def flush(self):
+        """Send all buffered actions to elasticsearch, and return the errors of
+        the documents that failed"""
+        with self.lock:
+            if not self.lines:
+                return {}
+            lines, uids = self.lines, self.uids
+            self.lines, self.uids, self.size, self.first_added = [], [], 0, None
+
+            log.info("Sending %s actions to ES._bulk()" % len(uids))
+
+            errors = {}
+            try:
+                r = get_es().bulk(
+                    body='\n'.join(lines) + '\n',
+                    refresh=self.refresh,
+                )
+            except Exception as e:
+                report_error("Failed to bulk index %s items in Elasticsearch. Got error: %s\nids=%s" % (len(uids), str(e), uids))
+                errors = {uid: str(e) for uid in uids}
+                self.errors.update(errors)
+                return errors
+
+            if r.get('errors'):
+                # Results are in the same order as the actions
+                for uid, res in zip(uids, r['items']):
+                    action, status = list(res.items())[0]
+                    # Deleting a missing document is not an error
+                    if 'error' in status and not (action == 'delete' and status.get('status') == 404):
+                        errors[uid] = status['error']
+
+            if errors:
+                report_error("Failed to bulk index %s out of %s items in Elasticsearch: %s" % (len(errors), len(uids), errors))
+                self.errors.update(errors)
+
+            return errors
+
+
+# Bulk indexer through which the current thread should index documents, if any
+bulk_context = threading.local()
+
+def set_bulk_indexer(indexer):
+    """Make the current thread index, update and delete documents through this
+    ESBulkIndexer, or index them directly again if indexer is None"""
+    bulk_context.indexer = indexer
+
+def get_bulk_indexer():
+    """Return the ESBulkIndexer active in the current thread, or None"""
+    return getattr(bulk_context, 'indexer', None)
+
+
 #
 # Get document
 #
@@ -101,8 +300,84 @@ def es_get_doc(index_name, doc_type, uid):
 # Search index
 #
 
-def es_search_index(index_name=None, doc_type=None, sort=[], query=None, page=None, item_per_page=None):
-    """Search the elasticsearch index and return hits"""
+#
+# Structured filters
+#
+
+# Item attributes that can be filtered on, and the keyword field of the
+# document they are matched against. Strings are dynamically mapped as text
+# with a keyword subfield, which ITEM_TEMPLATE pins down for new indexes,
+# along with the uid that searches are sorted on last.
+FILTER_FIELDS = {
+    'source': 'source.keyword',
+    'country': 'bdlitem.country.keyword',
+    'currency': 'bdlitem.currency.keyword',
+    'tags': 'bdlitem.tags.keyword',
+    'real': 'real',
+}
+
+KEYWORD = {
+    'type': 'text',
+    'fields': {
+        'keyword': {
+            'type': 'keyword',
+            'ignore_above': 256,
+        },
+    },
+}
+
+ITEM_TEMPLATE = {
+    'index_patterns': ['bdlitems-*'],
+    'mappings': {
+        'BDL_ITEM': {
+            'properties': {
+                'uid': KEYWORD,
+                'source': KEYWORD,
+                'real': {'type': 'boolean'},
+                'bdlitem': {
+                    'properties': {
+                        'country': KEYWORD,
+                        'currency': KEYWORD,
+                        'tags': KEYWORD,
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def es_put_item_template():
+    """Install the index template mapping the filterable attributes of items
+    in all bdlitems indexes created from now on"""
+    log.info("Putting index template 'bdlitems'")
+    get_es().indices.put_template(name='bdlitems', body=ITEM_TEMPLATE)
+
+
+def get_filter_clauses(filters):
+    """Take a dict of item attribute -> value, or list of values, and return
+    the matching elasticsearch term filters"""
+    clauses = []
+    for k in sorted(filters.keys()):
+        assert k in FILTER_FIELDS, "Cannot filter on attribute %s" % k
+        v = filters[k]
+        if type(v) in (list, tuple, set):
+            clauses.append({'terms': {FILTER_FIELDS[k]: sorted(v)}})
+        else:
+            clauses.append({'term': {FILTER_FIELDS[k]: v}})
+    return clauses
+
+
+def es_search_index(index_name=None, doc_type=None, sort=[], query=None, page=None, item_per_page=None, source=None, filters=None, search_after=None):
+    """Search the elasticsearch index and return hits. If source is a list of
+    attributes, hits contain only those attributes of the documents. If
+    filters is a dict of attribute -> value (or list of values), only
+    documents matching all of them are searched, without scoring them.
+
+    If search_after is set to the sort values of a hit (its 'sort'
+    attribute), return the hits following that one instead of those of
+    page. The sort should then end with a unique attribute, as a tiebreak.
+    """
 
     if not page:
         page = 0
@@ -111,11 +386,18 @@ def es_search_index(index_name=None, doc_type=None, sort=[], query=None, page=No
         query = ''
 
     esquery = {
-        'from': page * item_per_page,
         'size': item_per_page,
         'sort': sort
     }
 
+    if search_after:
+        esquery['search_after'] = search_after
+    else:
+        esquery['from'] = page * item_per_page
+
+    if source:
+        esquery['_source'] = source
+
     query = query.strip()
 
     # Build es query
@@ -131,12 +413,19 @@ def es_search_index(index_name=None, doc_type=None, sort=[], query=None, page=No
             }
         }
 
-
-    esquery['query'] = text_query
+    if filters:
+        esquery['query'] = {
+            'bool': {
+                'must': text_query,
+                'filter': get_filter_clauses(filters),
+            }
+        }
+    else:
+        esquery['query'] = text_query
 
     es = get_es()
 
-    log.info("Searching %s for '%s'" % (index_name, query))
+    log.info("Searching %s for '%s' (filters: %s)" % (index_name, query, filters))
     try:
         res = es.search(
             index=index_name,
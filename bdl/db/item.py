@@ -1,8 +1,18 @@
 import logging
+import threading
+import time
+import copy
+from collections import OrderedDict
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from boto3.dynamodb.conditions import Key
+from pymacaron_core.swagger.apipool import ApiPool
+from pymacaron.config import get_config
+from pymacaron.utils import to_epoch
 from bdl.model.item import model_to_item
 from bdl.exceptions import ItemNotFoundError
-from pymacaron_dynamodb import PersistentSwaggerObject, DynamoDBItemNotFound
+from pymacaron_dynamodb import PersistentSwaggerObject
+from bdl.io.dynamodb import get_table
 
 
 log = logging.getLogger(__name__)
@@ -30,7 +40,17 @@ def store_item(item):
             item.bdlitem.price_sold = str(price_sold)
     # End of float normalization
 
-    PersistentSwaggerObject.save_to_db(item)
+    # Through the current thread's DynamoDB resource, since items are stored
+    # by pools of threads
+    # The fingerprint is stored next to the item's properties, but is not part
+    # of its model
+    j = ApiPool.api.model_to_json(item)
+    if item.get_fingerprint():
+        j['fingerprint'] = item.get_fingerprint()
+
+    c = get_persistent_class(item)
+    get_table(c.table_name).put_item(Item=j)
+    get_item_cache().invalidate(item.item_id)
 
     # Restore float values
     if item.bdlitem:
@@ -63,62 +83,329 @@ class PersistentArchivedItem(PersistentSwaggerObject):
         store_item(item)
 
 
-def item_exists(item_id):
-    """Return true if this item exists"""
-    try:
-        get_item(item_id)
-        return True
-    except ItemNotFoundError:
-        return False
+def get_persistent_class(item):
+    """Return the PersistentSwaggerObject class of the table storing this item"""
+    if item.__class__.__name__ == 'ArchivedItem':
+        return PersistentArchivedItem
+    return PersistentItem
+
+
+def update_item_attributes(item, values=None, increments=None, index=True, index_extra=None, asynchronous=False, persistent_class=None):
+    """Partially update this item in its table, without rewriting it: set the
+    attributes in the dict 'values' to their (json) values, and atomically
+    add the numbers in the dict 'increments' to their attributes (missing
+    attributes count as 0). The new values of the incremented attributes are
+    set on the item.
+
+    Unless index is False or the item is archived, the same attributes, plus
+    those in the dict index_extra, are then updated in the item's
+    elasticsearch document.
+
+    persistent_class overrides the table the item is updated in, by default
+    that of the item's model.
+
+    Return a dict of the new values of all updated attributes.
+    """
+
+    values = values or {}
+    increments = increments or {}
+    assert values or increments
+
+    names = {}
+    expr_values = {}
+    clauses = []
+    for action, attributes in (('SET', values), ('ADD', increments)):
+        exprs = []
+        for k, v in sorted(attributes.items()):
+            n = len(names)
+            names['#a%s' % n] = k
+            expr_values[':v%s' % n] = v
+            exprs.append(('#a%s = :v%s' if action == 'SET' else '#a%s :v%s') % (n, n))
+        if exprs:
+            clauses.append('%s %s' % (action, ', '.join(exprs)))
+
+    c = persistent_class or get_persistent_class(item)
+    log.info("Updating %s of item %s" % (', '.join(sorted(list(values.keys()) + list(increments.keys()))), item.item_id))
+    r = get_table(c.table_name).update_item(
+        Key={'item_id': item.item_id},
+        UpdateExpression=' '.join(clauses),
+        ConditionExpression='attribute_exists(item_id)',
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=expr_values,
+        ReturnValues='UPDATED_NEW',
+    )
+    get_item_cache().invalidate(item.item_id)
+
+    # DynamoDB returns numbers as Decimals
+    new = {}
+    for k, v in r.get('Attributes', {}).items():
+        if isinstance(v, Decimal):
+            v = int(v) if v == v.to_integral_value() else float(v)
+        new[k] = v
+    for k in increments.keys():
+        if k in new:
+            setattr(item, k, new[k])
+
+    if index and c is PersistentItem:
+        doc = dict(values)
+        doc.update(new)
+        doc.update(index_extra or {})
+        item.update_in_es(doc, asynchronous=asynchronous)
+
+    return new
+
+
+def store_date_last_check(item):
+    """Update only the date_last_check of this item, in its table and, unless
+    it is archived, in elasticsearch"""
+    update_item_attributes(
+        item,
+        values={'date_last_check': item.date_last_check.isoformat()},
+        index_extra={'epoch_last_check': to_epoch(item.date_last_check)},
+    )
 
 
 def get_item(item_id):
+    """Retrieve an item from the item cache, or else from the item table or the
+    archive"""
+
+    cache = get_item_cache()
+    item = cache.get(item_id)
+    if item:
+        return item
+
+    generation = cache.generation
+    item = load_item(item_id)
+    cache.set(item, generation)
+    return item
+
+
+def load_item(item_id):
     """Retrieve an item from the item table, or the archive"""
     log.debug("Looking up item %s in items forsale" % item_id)
-    try:
-        p = PersistentItem.load_from_db(item_id)
-        model_to_item(p)
+    p = load_from_table(PersistentItem, item_id)
+    if p:
         return p
-    except DynamoDBItemNotFound:
-        pass
-    except Exception as e:
-        raise e
 
     log.debug("Looking up item %s in item archive" % item_id)
-    try:
-        p = PersistentArchivedItem.load_from_db(item_id)
-        model_to_item(p)
+    p = load_from_table(PersistentArchivedItem, item_id)
+    if p:
         return p
-    except DynamoDBItemNotFound:
-        log.debug("Item %s not found in Dynamodb" % item_id)
-        raise ItemNotFoundError(item_id)
+
+    log.debug("Item %s not found in Dynamodb" % item_id)
+    raise ItemNotFoundError(item_id)
+
+
+def load_from_table(c, item_id):
+    """Return the item with this item_id in the table of the
+    PersistentSwaggerObject class c, or None. Unlike c.load_from_db(), the
+    table is read through the current thread's DynamoDB resource"""
+    r = get_table(c.table_name).get_item(Key={c.primary_key: item_id})
+    if 'Item' not in r:
+        return None
+    return record_to_item(c, r['Item'])
+
+
+def record_to_item(c, record):
+    """Convert a record of the table of the PersistentSwaggerObject class c
+    into an item, setting aside its fingerprint, which is not part of the
+    model"""
+    fingerprint = record.pop('fingerprint', None)
+    i = c.to_model(record)
+    model_to_item(i)
+    i.set_fingerprint(fingerprint)
+    return i
+
+
+# Default size and ttl (in seconds) of the item cache, if item_cache_size and
+# item_cache_ttl are not set in the config
+ITEM_CACHE_SIZE = 1000
+ITEM_CACHE_TTL = 30
+
+
+class ItemCache():
+    """A bounded LRU cache of items by item_id, whose entries expire after ttl
+    seconds. Unknown item_ids are not cached, so that items created by other
+    processes are found right away.
+
+    Items are cached as json, so that every get() returns a new item that
+    callers are free to modify. Writes to the item tables must call
+    invalidate(). Since a lookup may race with a write, set() ignores items
+    looked up before the last invalidation.
+
+    The cache is per process: writes by other processes, such as the async
+    workers processing scraped objects, are seen only once the entry
+    expires. Code that modifies and writes back an item must therefore read
+    it with load_item() instead.
+    """
+
+    def __init__(self, maxsize=ITEM_CACHE_SIZE, ttl=ITEM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.entries = OrderedDict([
+            # item_id: (epoch_expires, model_name, json, fingerprint)
+        ])
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, item_id):
+        """Return a copy of the cached item, or None"""
+        with self.lock:
+            entry = self.entries.get(item_id)
+            if entry and entry[0] <= time.time():
+                del self.entries[item_id]
+                entry = None
+            if not entry:
+                self.misses = self.misses + 1
+                return None
+            self.entries.move_to_end(item_id)
+            self.hits = self.hits + 1
+
+        expires, model_name, j, fingerprint = entry
+        c = PersistentArchivedItem if model_name == 'ArchivedItem' else PersistentItem
+        item = c.to_model(copy.deepcopy(j))
+        model_to_item(item)
+        item.set_fingerprint(fingerprint)
+        return item
+
+    def set(self, item, generation):
+        """Cache this item, if looked up at this generation of the cache"""
+        entry = (time.time() + self.ttl, item.__class__.__name__, ApiPool.api.model_to_json(item), item.get_fingerprint())
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[item.item_id] = entry
+            self.entries.move_to_end(item.item_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, item_id):
+        with self.lock:
+            self.generation = self.generation + 1
+            self.entries.pop(item_id, None)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+item_cache = None
+item_cache_lock = threading.Lock()
+
+def get_item_cache():
+    """Return this process's ItemCache, set up from the config"""
+    global item_cache
+    with item_cache_lock:
+        if not item_cache:
+            conf = get_config()
+            item_cache = ItemCache(
+                maxsize=getattr(conf, 'item_cache_size', None) or ITEM_CACHE_SIZE,
+                ttl=getattr(conf, 'item_cache_ttl', None) or ITEM_CACHE_TTL,
+            )
+    return item_cache
 
 
 def get_item_by_native_url(native_url):
     """Retrieve an item from the item table, or the archive"""
 
+    resolver = get_native_url_resolver()
+    if resolver:
+        return resolver.get(native_url)
+
+    return query_item_by_native_url(native_url)
+
+
+def query_item_by_native_url(native_url):
+    """Query the item table, then the archive, for an item with this
+    native_url, through the current thread's DynamoDB resource"""
+
     # Try the Item table first
-    dbitems = PersistentItem.get_table().query(
+    dbitems = get_table(PersistentItem.table_name).query(
         IndexName='native_url-index',
         KeyConditionExpression=Key('native_url').eq(native_url)
     )
 
     assert dbitems['Count'] <= 1, "Found more than 1 Item with native_url: '%s'" % native_url
     if dbitems['Count'] == 1:
-        i = PersistentItem.to_model(dbitems['Items'][0])
-        model_to_item(i)
-        return i
+        return record_to_item(PersistentItem, dbitems['Items'][0])
 
     # Then the ArchivedItem table
-    dbitems = PersistentArchivedItem.get_table().query(
+    dbitems = get_table(PersistentArchivedItem.table_name).query(
         IndexName='native_url-index',
         KeyConditionExpression=Key('native_url').eq(native_url)
     )
 
     assert dbitems['Count'] <= 1, "Found more than 1 ArchivedItem with native_url: '%s'" % native_url
     if dbitems['Count'] == 1:
-        i = PersistentArchivedItem.to_model(dbitems['Items'][0])
-        model_to_item(i)
-        return i
+        return record_to_item(PersistentArchivedItem, dbitems['Items'][0])
 
     return None
+
+
+class NativeUrlResolver():
+    """Resolve the native urls of a whole batch of scraped objects into their
+    Item or ArchivedItem (or None) with parallel queries, and cache the results
+    for the duration of the batch.
+
+    A cached result is returned only once, and only if it is less than ttl
+    seconds old: once an object has been processed, its item may have been
+    created, updated or archived, so later lookups of the same native_url
+    query the tables again.
+    """
+
+    def __init__(self, concurrency=8, ttl=60):
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.cache = {
+            # native_url: (time fetched, item or None)
+        }
+
+    def prefetch(self, native_urls):
+        """Lookup all those native urls in parallel and cache the results"""
+        native_urls = list(set([u for u in native_urls if u]))
+        if not native_urls:
+            return
+
+        log.info("Prefetching items for %s native urls" % len(native_urls))
+
+        def fetch(native_url):
+            try:
+                item = query_item_by_native_url(native_url)
+            except Exception as e:
+                # get() will query again for this url
+                log.warn("Failed to prefetch item for %s: %s" % (native_url, str(e)))
+                return
+            with self.lock:
+                self.cache[native_url] = (time.time(), item)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(fetch, native_urls))
+
+    def get(self, native_url):
+        """Return the item with this native_url, from the cache if possible"""
+        with self.lock:
+            cached = self.cache.pop(native_url, None)
+        if cached and time.time() - cached[0] < self.ttl:
+            log.debug("Found prefetched item for %s" % native_url)
+            return cached[1]
+        return query_item_by_native_url(native_url)
+
+
+# Native url resolver used by the current thread, if any
+resolver_context = threading.local()
+
+def set_native_url_resolver(resolver):
+    """Make get_item_by_native_url() use this NativeUrlResolver in the current
+    thread, or query the tables directly again if resolver is None"""
+    resolver_context.resolver = resolver
+
+def get_native_url_resolver():
+    """Return the NativeUrlResolver active in the current thread, or None"""
+    return getattr(resolver_context, 'resolver', None)
@@ -0,0 +1,212 @@
+import os
+import logging
+import threading
+import atexit
+import time
+from botocore.exceptions import ClientError
+from pymacaron.config import get_config
+from bdl.db.item import update_item_attributes, PersistentArchivedItem
+from bdl.db.elasticsearch import ESBulkIndexer
+
+
+log = logging.getLogger(__name__)
+
+
+# Default flush period and size of the view counter, if view_flush_seconds
+# and view_flush_count are not set in the config
+VIEW_FLUSH_SECONDS = 10
+VIEW_FLUSH_COUNT = 100
+
+
+class ViewCounter():
+    """Aggregate the views of items in memory, and store them in batches: a
+    background thread flushes the pending views every max_seconds seconds,
+    or as soon as max_views views are pending, with one atomic increment of
+    count_views per viewed item in DynamoDB and one elasticsearch _bulk
+    request for all of them. Pending views are also flushed when the
+    process exits.
+
+    Until they are stored, an item's pending views are added to the
+    count_views of every copy of it passed to add(), so that a process sees
+    its own views whether the item was read from DynamoDB or from the item
+    cache.
+
+    get_stats() returns the number of pending views and the duration of the
+    last flush. They are logged after every flush.
+    """
+
+    def __init__(self, max_seconds=VIEW_FLUSH_SECONDS, max_views=VIEW_FLUSH_COUNT):
+        self.max_seconds = max_seconds
+        self.max_views = max_views
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.stopped = False
+        self.pending = {
+            # item_id: [item, number of views]
+        }
+        self.flushing = {
+            # item_id: number of views being stored
+        }
+        self.count_pending = 0
+        self.count_flushes = 0
+        self.count_flushed = 0
+        self.last_flush_seconds = None
+
+    def add(self, item, views=1):
+        """Count views of this item, as read from its table or the item cache.
+        The item's count_views is incremented right away by all its views not
+        stored yet, and those views are stored at the next flush"""
+        with self.lock:
+            self.start()
+            if item.item_id in self.pending:
+                self.pending[item.item_id][0] = item
+                self.pending[item.item_id][1] += views
+            else:
+                self.pending[item.item_id] = [item, views]
+            self.count_pending = self.count_pending + views
+            unstored = self.pending[item.item_id][1] + self.flushing.get(item.item_id, 0)
+            if self.count_pending >= self.max_views:
+                self.wakeup.set()
+        item.count_views = (item.count_views or 0) + unstored
+
+    def start(self):
+        """Start the flushing thread, if not already running in this process"""
+        if self.thread and self.pid == os.getpid():
+            return
+        if self.pid:
+            # In a forked process: the parent stores its own pending views
+            self.pending, self.flushing, self.count_pending = {}, {}, 0
+        else:
+            atexit.register(self.stop)
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name='ViewCounter', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.max_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.warn("Failed to flush item views: %s" % str(e))
+
+    def stop(self):
+        """Stop the flushing thread and flush the pending views"""
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread and self.pid == os.getpid():
+            self.thread.join(self.max_seconds)
+        self.flush()
+
+    def flush(self):
+        """Store all pending views"""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending, self.count_pending = self.pending, {}, 0
+                for item_id, (item, views) in pending.items():
+                    self.flushing[item_id] = views
+            if not pending:
+                return
+
+            log.info("Storing views of %s items" % len(pending))
+            t0 = time.time()
+            flushed = 0
+
+            with ESBulkIndexer():
+                for item_id, (item, views) in pending.items():
+                    if self.store(item, views):
+                        flushed = flushed + views
+                    else:
+                        self.requeue(item, views)
+                    with self.lock:
+                        self.flushing.pop(item_id, None)
+
+            self.last_flush_seconds = time.time() - t0
+            self.count_flushes = self.count_flushes + 1
+            self.count_flushed = self.count_flushed + flushed
+            log.info("Stored views of %s items in %.3f sec" % (len(pending), self.last_flush_seconds))
+            log.info("View counter stats: %s" % self.get_stats())
+
+    def flush_item(self, item):
+        """Store now the pending views of this item, and set its count_views
+        to the stored value. Called before the item is archived, so that its
+        archived copy includes all its views"""
+        with self.flush_lock:
+            with self.lock:
+                entry = self.pending.pop(item.item_id, None)
+                if not entry:
+                    return
+                views = entry[1]
+                self.count_pending = self.count_pending - views
+            if not self.store(item, views):
+                self.requeue(item, views)
+
+    def store(self, item, views):
+        """Add those views to the item's count_views in its table, or in the
+        archive if the item was archived meanwhile. Return False if the views
+        should be retried later"""
+        item_id = item.item_id
+        try:
+            try:
+                update_item_attributes(item, increments={'count_views': views})
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                log.info("Item %s is gone: storing its %s views in the archive" % (item_id, views))
+                update_item_attributes(item, increments={'count_views': views}, persistent_class=PersistentArchivedItem)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                log.info("Item %s is not archived either: dropping its %s views" % (item_id, views))
+                return True
+            log.warn("Failed to store %s views of item %s: %s" % (views, item_id, str(e)))
+        except Exception as e:
+            log.warn("Failed to store %s views of item %s: %s" % (views, item_id, str(e)))
+        return False
+
+    def requeue(self, item, views):
+        """Put back views that failed to be stored, to retry at the next flush"""
+        with self.lock:
+            if item.item_id in self.pending:
+                self.pending[item.item_id][1] += views
+            else:
+                self.pending[item.item_id] = [item, views]
+            self.count_pending = self.count_pending + views
+
+    def get_stats(self):
+        """Return the view counter's metrics"""
+        with self.lock:
+            return {
+                'pending_views': self.count_pending,
+                'pending_items': len(self.pending),
+                'flushes': self.count_flushes,
+                'flushed_views': self.count_flushed,
+                'last_flush_seconds': self.last_flush_seconds,
+            }
+
+
+view_counter = None
+view_counter_lock = threading.Lock()
+
+def get_view_counter():
+    """Return this process's ViewCounter, set up from the config"""
+    global view_counter
+    with view_counter_lock:
+        if not view_counter:
+            conf = get_config()
+            view_counter = ViewCounter(
+                max_seconds=getattr(conf, 'view_flush_seconds', None) or VIEW_FLUSH_SECONDS,
+                max_views=getattr(conf, 'view_flush_count', None) or VIEW_FLUSH_COUNT,
+            )
+    return view_counter
+
+
+def flush_item_views(item):
+    """Store the views of this item that are pending in this process, if any.
+    Processes that never counted views don't get a view counter"""
+    if view_counter:
+        view_counter.flush_item(item)
@@ -1,7 +1,12 @@
 import logging
+import threading
+import hashlib
+import time
 import boto3
+from collections import OrderedDict
 from pymacaron.config import get_config
 from pymacaron.crash import report_error
+from bdl.io.dynamodb import get_dynamodb, get_table
 
 
 log = logging.getLogger(__name__)
@@ -26,7 +31,50 @@ def get_comprehend():
     return client
 
 
+# Max number of documents per batch_detect_dominant_language call
+BATCH_SIZE = 25
+
+
+def get_top_language(languages):
+    """Return the language code with the highest score in a list of
+    comprehend languages, or None"""
+    top_language = None
+    top_score = 0
+    for d in languages:
+        log.debug("Identified language %s (score: %s)" % (d['LanguageCode'], d['Score']))
+        if d['Score'] > top_score:
+            top_language = d['LanguageCode']
+            top_score = d['Score']
+    return top_language
+
+
 def identify_language(text):
+    """Return the language of this text, from the active LanguageResolver or
+    the language cache if they have it, or else by calling comprehend"""
+
+    resolver = get_language_resolver()
+    if resolver:
+        language = resolver.get(text)
+        if language:
+            return language
+
+    cache = get_language_cache()
+    language = cache.get(text)
+    if language:
+        return language
+
+    language = detect_language(text)
+    if not language:
+        report_error("Amazon Comprend failed to identify language in [%s]" % text)
+        return 'en'
+
+    cache.set(text, language)
+    return language
+
+
+def detect_language(text):
+    """Identify the language of this text with one call to comprehend, or
+    return None if comprehend could not tell"""
     log.debug("Calling AWS comprehend on text '%s'" % text)
     r = get_comprehend().detect_dominant_language(
         Text=text
@@ -42,13 +90,255 @@ def identify_language(text):
     # }
 
     if 'Languages' in r and len(r['Languages']) > 0:
-        top_language = None
-        top_score = 0
-        for d in r['Languages']:
-            log.debug("Identified language %s (score: %s)" % (d['LanguageCode'], d['Score']))
-            if d['Score'] > top_score:
-                top_language = d['LanguageCode']
-        return top_language
-
-    report_error("Amazon Comprend failed to identify language in [%s]" % text)
-    return 'en'
+        return get_top_language(r['Languages'])
+
+    return None
+
+
+def detect_languages(texts):
+    """Identify the languages of up to BATCH_SIZE texts with one call to
+    comprehend. Return a list of languages in the same order as the texts,
+    with None for the texts comprehend failed to identify"""
+    assert len(texts) <= BATCH_SIZE
+
+    log.debug("Calling AWS comprehend on %s texts" % len(texts))
+    r = get_comprehend().batch_detect_dominant_language(
+        TextList=texts
+    )
+
+    # Response:
+    # {
+    #   'ResultList': [
+    #     {'Index': 0, 'Languages': [{'Score': 0.99, 'LanguageCode': 'en'}]},
+    #   ],
+    #   'ErrorList': [
+    #     {'Index': 1, 'ErrorCode': '...', 'ErrorMessage': '...'},
+    #   ],
+    #   'ResponseMetadata': ...
+    # }
+
+    languages = [None] * len(texts)
+    for d in r.get('ResultList', []):
+        languages[d['Index']] = get_top_language(d['Languages'])
+    for d in r.get('ErrorList', []):
+        log.warn("Comprehend failed to identify language of text %s: %s %s" % (d['Index'], d['ErrorCode'], d['ErrorMessage']))
+
+    return languages
+
+
+class LanguageResolver():
+    """Identify the languages of a whole batch of texts with as few calls to
+    comprehend as possible, and cache the results for the duration of the
+    batch. Texts that comprehend failed to identify in a batch call are
+    identified one by one when asked for.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = {
+            # text: language
+        }
+
+    def prefetch(self, texts):
+        """Identify the languages of all those texts, BATCH_SIZE at a time"""
+        texts = list(OrderedDict.fromkeys([t for t in texts if t and t not in self.cache]))
+        if not texts:
+            return
+
+        # Skip the texts whose language is already known
+        cache = get_language_cache()
+        cached = cache.get_many(texts)
+        with self.lock:
+            self.cache.update(cached)
+        texts = [t for t in texts if t not in cached]
+        log.debug("Language cache stats: %s" % cache.get_stats())
+        if not texts:
+            return
+
+        log.info("Identifying languages of %s texts" % len(texts))
+
+        for i in range(0, len(texts), BATCH_SIZE):
+            batch = texts[i:i + BATCH_SIZE]
+            try:
+                languages = detect_languages(batch)
+            except Exception as e:
+                # get() will call comprehend again for those texts
+                log.warn("Failed to identify languages of %s texts: %s" % (len(batch), str(e)))
+                continue
+            identified = dict([(t, l) for t, l in zip(batch, languages) if l])
+            with self.lock:
+                self.cache.update(identified)
+            cache.set_many(identified)
+
+    def get(self, text):
+        """Return the language of this text if it was prefetched, or None"""
+        with self.lock:
+            return self.cache.get(text)
+
+
+# Language resolver used by the current thread, if any
+resolver_context = threading.local()
+
+def set_language_resolver(resolver):
+    """Make identify_language() use this LanguageResolver in the current
+    thread, or call comprehend directly again if resolver is None"""
+    resolver_context.resolver = resolver
+
+def get_language_resolver():
+    """Return the LanguageResolver active in the current thread, or None"""
+    return getattr(resolver_context, 'resolver', None)
+
+
+#
+# Cache of the languages identified by comprehend
+#
+
+# Default size and ttl (in seconds) of the language cache, if
+# language_cache_size and language_cache_ttl are not set in the config
+LANGUAGE_CACHE_SIZE = 10000
+LANGUAGE_CACHE_TTL = 30 * 24 * 3600
+
+
+class LanguageCache():
+    """A bounded LRU cache of the languages identified by comprehend, keyed by
+    a hash of the text, whose entries expire after ttl seconds.
+
+    If table_name is set, the cache is backed by that DynamoDB table (with
+    text_hash as primary key), so that it is shared between processes and
+    survives restarts. Keep the table's TTL attribute set to epoch_expires.
+    """
+
+    def __init__(self, maxsize=LANGUAGE_CACHE_SIZE, ttl=LANGUAGE_CACHE_TTL, table_name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.table_name = table_name
+        self.lock = threading.Lock()
+        self.entries = OrderedDict([
+            # text_hash: (epoch_expires, language)
+        ])
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+
+    def get_key(self, text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_table(self):
+        """Return the table backing the cache, as a resource of the current
+        thread: languages are looked up by the threads processing items"""
+        return get_table(self.table_name)
+
+    def get_stats(self):
+        """Return the cache's size and hit/miss counters"""
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+            }
+
+    def get(self, text):
+        """Return the cached language of this text, or None"""
+        return self.get_many([text]).get(text)
+
+    def get_many(self, texts):
+        """Return a dict of text -> language for all those texts whose
+        language is in the cache"""
+        now = int(time.time())
+        keys = OrderedDict([(self.get_key(t), t) for t in texts])
+        found = {}
+
+        with self.lock:
+            for key, text in keys.items():
+                entry = self.entries.get(key)
+                if entry and entry[0] > now:
+                    self.entries.move_to_end(key)
+                    found[text] = entry[1]
+                elif entry:
+                    del self.entries[key]
+
+        missing = [k for k, t in keys.items() if t not in found]
+        from_db = self.get_many_from_db(missing, now) if self.table_name and missing else {}
+        for key, (expires, language) in from_db.items():
+            found[keys[key]] = language
+            self.put(key, language, expires)
+
+        with self.lock:
+            self.hits = self.hits + len(found) - len(from_db)
+            self.db_hits = self.db_hits + len(from_db)
+            self.misses = self.misses + len(keys) - len(found)
+
+        return found
+
+    def get_many_from_db(self, keys, now):
+        """Return a dict of text_hash -> (epoch_expires, language) of the
+        unexpired entries with those keys in the DynamoDB table"""
+        found = {}
+        for i in range(0, len(keys), 100):
+            try:
+                r = get_dynamodb().batch_get_item(
+                    RequestItems={
+                        self.table_name: {
+                            'Keys': [{'text_hash': k} for k in keys[i:i + 100]],
+                        }
+                    }
+                )
+            except Exception as e:
+                log.warn("Failed to read language cache table %s: %s" % (self.table_name, str(e)))
+                continue
+            for item in r.get('Responses', {}).get(self.table_name, []):
+                expires = int(item['epoch_expires'])
+                if expires > now:
+                    found[item['text_hash']] = (expires, item['language'])
+        return found
+
+    def put(self, key, language, expires):
+        with self.lock:
+            self.entries[key] = (expires, language)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def set(self, text, language):
+        """Cache the language of this text"""
+        self.set_many({text: language})
+
+    def set_many(self, languages):
+        """Cache the languages in this dict of text -> language"""
+        if not languages:
+            return
+
+        expires = int(time.time()) + self.ttl
+        items = [(self.get_key(t), l) for t, l in languages.items()]
+        for key, language in items:
+            self.put(key, language, expires)
+
+        if self.table_name:
+            try:
+                with self.get_table().batch_writer() as batch:
+                    for key, language in items:
+                        batch.put_item(Item={
+                            'text_hash': key,
+                            'language': language,
+                            'epoch_expires': expires,
+                        })
+            except Exception as e:
+                log.warn("Failed to write to language cache table %s: %s" % (self.table_name, str(e)))
+
+
+language_cache = None
+language_cache_lock = threading.Lock()
+
+def get_language_cache():
+    """Return this process's LanguageCache, set up from the config"""
+    global language_cache
+    with language_cache_lock:
+        if not language_cache:
+            conf = get_config()
+            language_cache = LanguageCache(
+                maxsize=getattr(conf, 'language_cache_size', None) or LANGUAGE_CACHE_SIZE,
+                ttl=getattr(conf, 'language_cache_ttl', None) or LANGUAGE_CACHE_TTL,
+                table_name=getattr(conf, 'language_cache_table', None),
+            )
+    return language_cache
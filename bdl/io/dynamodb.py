@@ -0,0 +1,39 @@
+import logging
+import threading
+import boto3
+from pymacaron.config import get_config
+
+
+log = logging.getLogger(__name__)
+
+
+# boto3 sessions and resources are not thread-safe, and items are processed by
+# pools of threads: each thread gets its own session and DynamoDB resource,
+# instead of sharing the one of pymacaron_dynamodb.get_dynamodb()
+dynamodb_context = threading.local()
+
+
+def get_dynamodb():
+    """Return the current thread's DynamoDB resource"""
+    db = getattr(dynamodb_context, 'db', None)
+    if not db:
+        conf = get_config()
+        session = boto3.session.Session(
+            region_name=conf.aws_region if conf.aws_region else conf.aws_default_region,
+            aws_access_key_id=conf.aws_access_key_id,
+            aws_secret_access_key=conf.aws_secret_access_key,
+        )
+        db = session.resource('dynamodb')
+        dynamodb_context.db = db
+        dynamodb_context.tables = {}
+    return db
+
+
+def get_table(table_name):
+    """Return the current thread's Table resource for this table"""
+    db = get_dynamodb()
+    table = dynamodb_context.tables.get(table_name)
+    if not table:
+        table = db.Table(table_name)
+        dynamodb_context.tables[table_name] = table
+    return table
@@ -1,5 +1,8 @@
+import os
 import logging
 import json
+import threading
+from requests.adapters import HTTPAdapter
 from pymacaron.config import get_config
 from requests_aws4auth import AWS4Auth
 from elasticsearch import Elasticsearch, RequestsHttpConnection, serializer, compat, exceptions
@@ -8,6 +11,15 @@ from elasticsearch import Elasticsearch, RequestsHttpConnection, serializer, com
 log = logging.getLogger(__name__)
 
 
+# Defaults for the HTTP connections to elasticsearch, that may be overriden in
+# pym-config.yaml
+ES_POOL_MAXSIZE = 10
+ES_KEEP_ALIVE = True
+ES_TIMEOUT = 10
+ES_MAX_RETRIES = 3
+ES_RETRY_ON_TIMEOUT = True
+
+
 # Copy/pasted from https://github.com/elastic/elasticsearch-py/issues/374
 class JSONSerializerPython2(serializer.JSONSerializer):
     """Override elasticsearch library serializer to ensure it encodes utf characters during json dump.
@@ -25,8 +37,33 @@ class JSONSerializerPython2(serializer.JSONSerializer):
             raise exceptions.SerializationError(data, e)
 
 
+class PooledRequestsHttpConnection(RequestsHttpConnection):
+    """A RequestsHttpConnection whose session keeps up to pool_maxsize
+    connections alive to the elasticsearch host, so that concurrent threads
+    reuse open TLS connections instead of doing a new handshake per request"""
+
+    def __init__(self, pool_maxsize=ES_POOL_MAXSIZE, keep_alive=ES_KEEP_ALIVE, **kwargs):
+        super().__init__(**kwargs)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+
+# The Elasticsearch client is shared by all threads of a process
+es_lock = threading.Lock()
+es_client = None
+es_client_key = None
+es_client_pid = None
+
+
 def get_es(config_path=None, host=None, aws_access_key_id=None, aws_secret_access_key=None, aws_region=None):
-    """Return an instance of Elasticsearch"""
+    """Return the process-wide instance of Elasticsearch. It is created on first
+    call, and only rebuilt when the config or credentials change, or in a
+    forked child process (which must not share its parent's connections)"""
+    global es_lock, es_client, es_client_key, es_client_pid
+
     conf = get_config(path=config_path)
     if not aws_access_key_id:
         aws_access_key_id = conf.aws_access_key_id
@@ -36,20 +73,50 @@ def get_es(config_path=None, host=None, aws_access_key_id=None, aws_secret_acces
         aws_region = conf.aws_region
     if not host:
         host = conf.es_search_host
-    awsauth = AWS4Auth(
-        aws_access_key_id,
-        aws_secret_access_key,
-        aws_region,
-        'es'
-    )
-
-    es = Elasticsearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=awsauth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        serializer=JSONSerializerPython2()
-    )
-
-    return es
+
+    def get_setting(name, default):
+        v = getattr(conf, name, None)
+        return default if v is None else v
+
+    settings = {
+        'pool_maxsize': int(get_setting('es_pool_maxsize', ES_POOL_MAXSIZE)),
+        'keep_alive': get_setting('es_keep_alive', ES_KEEP_ALIVE),
+        'timeout': get_setting('es_timeout', ES_TIMEOUT),
+        'max_retries': int(get_setting('es_max_retries', ES_MAX_RETRIES)),
+        'retry_on_timeout': get_setting('es_retry_on_timeout', ES_RETRY_ON_TIMEOUT),
+    }
+
+    key = (host, aws_access_key_id, aws_secret_access_key, aws_region, tuple(sorted(settings.items())))
+    pid = os.getpid()
+
+    if es_client_pid is not None and es_client_pid != pid:
+        # We are in a forked process: the lock may have been held by another
+        # thread of the parent at the time of the fork
+        es_lock = threading.Lock()
+
+    with es_lock:
+        if es_client and es_client_key == key and es_client_pid == pid:
+            return es_client
+
+        log.info("Creating Elasticsearch client for %s (pid %s, pool size %s)" % (host, pid, settings['pool_maxsize']))
+
+        awsauth = AWS4Auth(
+            aws_access_key_id,
+            aws_secret_access_key,
+            aws_region,
+            'es'
+        )
+
+        es_client = Elasticsearch(
+            hosts=[{'host': host, 'port': 443}],
+            http_auth=awsauth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=PooledRequestsHttpConnection,
+            serializer=JSONSerializerPython2(),
+            **settings
+        )
+        es_client_key = key
+        es_client_pid = pid
+
+        return es_client
@@ -1,4 +1,7 @@
+import io
 import logging
+import threading
+from boto.s3.key import Key
 from pymacaron.config import get_config
 from boto import s3
 
@@ -9,11 +12,13 @@ from boto.s3.connection import ProtocolIndependentOrdinaryCallingFormat
 log = logging.getLogger(__name__)
 
 
-conn = None
+# boto connections are not thread-safe: each thread gets its own
+conn_context = threading.local()
 
 
 def get_s3_conn():
-    global conn
+    """Return the current thread's S3 connection"""
+    conn = getattr(conn_context, 'conn', None)
     if not conn:
         conf = get_config()
         conn = s3.connect_to_region(
@@ -22,5 +27,76 @@ def get_s3_conn():
             aws_secret_access_key=conf.aws_secret_access_key,
             calling_format=ProtocolIndependentOrdinaryCallingFormat()
         )
+        conn_context.conn = conn
 
     return conn
+
+
+# Size of the parts of multipart uploads. S3 requires all parts but the last
+# one to be at least 5Mb
+S3_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3UploadStream():
+    """A write-only binary file-like object uploading what is written to it
+    into a public S3 key. Data is buffered until part_size bytes are pending,
+    then sent as one part of a multipart upload, so that only one part is
+    ever held in memory. Smaller files are uploaded in one request by close().
+    """
+
+    def __init__(self, bucket_name, key_name, content_type='application/octet-stream', part_size=S3_PART_SIZE):
+        self.bucket_name = bucket_name
+        self.key_name = key_name
+        self.content_type = content_type
+        self.part_size = part_size
+        self.buffer = io.BytesIO()
+        self.upload = None
+        self.count_parts = 0
+        self.size = 0
+
+    def get_bucket(self):
+        return get_s3_conn().get_bucket(self.bucket_name)
+
+    def write(self, data):
+        self.buffer.write(data)
+        self.size = self.size + len(data)
+        if self.buffer.tell() >= self.part_size:
+            self.upload_part()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def upload_part(self):
+        if not self.upload:
+            log.info("Starting multipart upload of %s" % self.key_name)
+            self.upload = self.get_bucket().initiate_multipart_upload(
+                self.key_name,
+                headers={'Content-Type': self.content_type},
+                policy='public-read',
+            )
+        self.count_parts = self.count_parts + 1
+        self.buffer.seek(0)
+        self.upload.upload_part_from_file(self.buffer, self.count_parts)
+        self.buffer = io.BytesIO()
+
+    def close(self):
+        """Upload the remaining data and complete the upload"""
+        if self.upload:
+            if self.buffer.tell():
+                self.upload_part()
+            self.upload.complete_upload()
+        else:
+            k = Key(self.get_bucket())
+            k.key = self.key_name
+            k.set_metadata('Content-Type', self.content_type)
+            k.set_contents_from_string(self.buffer.getvalue())
+            k.set_acl('public-read')
+        log.info("Uploaded %s bytes to %s" % (self.size, self.key_name))
+        self.buffer = None
+
+    def abort(self):
+        """Discard the data written so far"""
+        if self.upload:
+            self.upload.cancel_upload()
+        self.buffer = None
@@ -0,0 +1,146 @@
+import logging
+from bdl.tagger import text_to_words
+from bdl.utils import html_to_unicode
+
+
+log = logging.getLogger(__name__)
+
+
+#
+# Offline language identification, based on the most frequent words of each
+# language we see in announces, and on the letters specific to some of them.
+# Good enough to recognize most announces without calling Amazon comprehend.
+#
+
+STOPWORDS = {
+    'en': [
+        'the', 'and', 'of', 'to', 'in', 'is', 'for', 'with', 'on', 'this',
+        'that', 'it', 'as', 'from', 'are', 'be', 'by', 'or', 'have', 'has',
+        'was', 'very', 'good', 'condition', 'new', 'used', 'size', 'price',
+        'sale', 'only', 'not', 'but', 'all', 'your', 'can', 'will', 'an', 'at',
+        'never', 'worn', 'original', 'excellent',
+    ],
+    'sv': [
+        'och', 'att', 'det', 'som', 'en', 'är', 'på', 'för', 'med', 'av',
+        'till', 'den', 'har', 'inte', 'om', 'ett', 'men', 'var', 'jag', 'vi',
+        'så', 'från', 'kan', 'eller', 'mycket', 'finns', 'säljes', 'säljer',
+        'bra', 'skick', 'nytt', 'fint', 'utan', 'också', 'hämtas', 'använd',
+        'oanvänd', 'köpt', 'nästan', 'endast', 'i', 'st', 'kr',
+    ],
+    'da': [
+        'og', 'at', 'det', 'som', 'en', 'er', 'på', 'for', 'med', 'af', 'til',
+        'den', 'har', 'ikke', 'om', 'et', 'men', 'var', 'jeg', 'vi', 'så',
+        'fra', 'kan', 'eller', 'meget', 'sælges', 'købt', 'god', 'stand',
+        'pæn', 'brugt', 'også', 'næsten', 'kun', 'i',
+    ],
+    'no': [
+        'og', 'at', 'det', 'som', 'en', 'er', 'på', 'for', 'med', 'av', 'til',
+        'den', 'har', 'ikke', 'om', 'et', 'men', 'var', 'jeg', 'vi', 'så',
+        'fra', 'kan', 'eller', 'mye', 'selges', 'kjøpt', 'god', 'stand', 'pent',
+        'brukt', 'også', 'nesten', 'kun', 'i',
+    ],
+    'fr': [
+        'le', 'la', 'les', 'de', 'des', 'du', 'et', 'est', 'en', 'un', 'une',
+        'pour', 'avec', 'dans', 'sur', 'au', 'aux', 'par', 'pas', 'très', 'bon',
+        'état', 'neuf', 'vendu', 'prix', 'ce', 'cette', 'qui', 'que', 'il',
+        'elle', 'je', 'nous', 'vous', 'sac', 'taille', 'plus', 'sans', 'à',
+    ],
+    'de': [
+        'der', 'die', 'das', 'und', 'ist', 'nicht', 'mit', 'von', 'zu', 'den',
+        'ein', 'eine', 'für', 'auf', 'im', 'dem', 'des', 'sich', 'auch', 'es',
+        'sehr', 'gut', 'zustand', 'neu', 'gebraucht', 'verkaufe', 'preis',
+        'oder', 'aus', 'wie', 'bei', 'nur', 'noch', 'ich', 'wir', 'sie',
+    ],
+    'es': [
+        'el', 'la', 'los', 'las', 'de', 'del', 'y', 'es', 'en', 'un', 'una',
+        'para', 'con', 'por', 'que', 'muy', 'buen', 'estado', 'nuevo', 'precio',
+        'se', 'su', 'al', 'lo', 'como', 'más', 'pero', 'sin', 'vendo', 'talla',
+    ],
+    'it': [
+        'il', 'lo', 'la', 'gli', 'le', 'di', 'del', 'della', 'e', 'è', 'un',
+        'una', 'per', 'con', 'da', 'che', 'non', 'molto', 'buono', 'stato',
+        'nuovo', 'prezzo', 'sono', 'alla', 'nel', 'anche', 'vendo', 'come',
+        'più',
+    ],
+}
+
+# Letters used by only a few of those languages
+LETTERS = {
+    'ä': ['sv', 'de'],
+    'ö': ['sv', 'de'],
+    'å': ['sv', 'da', 'no'],
+    'æ': ['da', 'no'],
+    'ø': ['da', 'no'],
+    'ß': ['de'],
+    'ü': ['de'],
+    'ç': ['fr'],
+    'è': ['fr', 'it'],
+    'ê': ['fr'],
+    'ñ': ['es'],
+}
+
+# Minimum score of the best language for a guess to be trusted
+MIN_SCORE = 2
+
+# Below this confidence, guess_language() returns no language
+MIN_CONFIDENCE = 0.5
+
+
+# word -> languages it belongs to
+WORD_LANGUAGES = {}
+for lang, words in STOPWORDS.items():
+    for w in words:
+        WORD_LANGUAGES.setdefault(w, []).append(lang)
+
+
+def score_languages(text):
+    """Return a dict of language -> score of the text in that language. Every
+    common word and specific letter found in the text adds 1 to the score,
+    split between all the languages it belongs to."""
+    text = html_to_unicode(text).lower()
+
+    scores = {}
+
+    def add(languages):
+        for language in languages:
+            scores[language] = scores.get(language, 0) + 1.0 / len(languages)
+
+    for w in text_to_words(text):
+        if w in WORD_LANGUAGES:
+            add(WORD_LANGUAGES[w])
+
+    for letter, languages in LETTERS.items():
+        if letter in text:
+            add(languages)
+
+    return scores
+
+
+def guess_language(text):
+    """Identify the language of this text offline. Return a tuple (language,
+    confidence), where confidence is between 0 and 1 and measures how much the
+    best language scores above the second best one, or (None, 0) if the text
+    has too few recognizable words.
+    """
+
+    scores = score_languages(text)
+    ranked = sorted(scores.items(), key=lambda t: t[1], reverse=True)
+
+    if not ranked or ranked[0][1] < MIN_SCORE:
+        return None, 0
+
+    language, top = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0
+    confidence = (top - second) / top
+
+    log.debug("Guessed language %s (confidence %.2f, scores %s)" % (language, confidence, scores))
+    return language, confidence
+
+
+def identify_language_locally(text):
+    """Return the language of this text, or None if it cannot be identified
+    with enough confidence without calling Amazon comprehend"""
+    language, confidence = guess_language(text)
+    if language and confidence >= MIN_CONFIDENCE:
+        return language
+    return None
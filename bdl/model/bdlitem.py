@@ -1,5 +1,7 @@
 import logging
 import re
+import json
+import hashlib
 from unidecode import unidecode
 from pymacaron.utils import timenow
 from s3imageresizer import S3ImageResizer
@@ -12,12 +14,24 @@ from bdl.tagger import get_matching_tags
 from bdl.categories import get_categories
 from bdl.db.item import get_item_by_native_url
 from bdl.io.comprehend import identify_language
+from bdl.language import identify_language_locally
 from bdl.categories import SOLD, BLACKLIST_ALL
+from bdl.categories import get_curation_lists, CurationVerdict
 
 
 log = logging.getLogger(__name__)
 
 
+# The scraped attributes that update() copies into an item when they change
+# NOTE: we should absolutly not update the native_url
+UPDATED_ATTRIBUTES = [
+    'title', 'description', 'price', 'currency', 'language', 'country',
+    'location', 'price_is_fixed', 'native_doc_id', 'native_seller_id',
+    'native_seller_name', 'native_seller_is_shop', 'native_group_id',
+    'native_location',
+]
+
+
 def model_to_bdlitem(o):
     """Take a bravado object or ES dict and return a BDLItem"""
     mixin(o, BDLItem)
@@ -30,21 +44,23 @@ def model_to_bdlitem(o):
     if hasattr(o, 'epoch_published') and o.epoch_published:
         o.epoch_published = int(o.epoch_published)
 
-    # Monkey patch __str__
-    def str(self):
+
+class BDLItem():
+    """An announce on bazardelux"""
+
+    __slots__ = ()
+
+    def __str__(self):
         if not self.title:
             return '<BDLItem>'
         return "<BDLItem '%s%s'%s>" % (
             self.title[0:20], '..' if len(self.title) > 20 else '',
             ' %s %s' % (self.price, self.currency) if self.price and self.currency else '',
         )
-    o.__class__.__str__ = str
-    o.__class__.__repr__ = str
-    o.__class__.__unicode__ = str
 
+    __repr__ = __str__
+    __unicode__ = __str__
 
-class BDLItem():
-    """An announce on bazardelux"""
 
     def index_name(self):
         return 'bdlitems'
@@ -90,8 +106,12 @@ class BDLItem():
 
 
     def identify_language(self):
-        """Use Amazon comprehend to identify the announce's language, prior to curation"""
-        self.language = identify_language(self.get_text())
+        """Identify the announce's language, prior to curation. Try offline
+        first, and only call Amazon comprehend if that is inconclusive"""
+        text = self.get_text()
+        self.language = identify_language_locally(text)
+        if not self.language:
+            self.language = identify_language(text)
 
 
     def set_tags(self, reset=False):
@@ -243,6 +263,14 @@ class BDLItem():
             self.date_sold = self.date_ended
 
 
+    def get_fingerprint(self):
+        """Return a hash of all the scraped attributes that update() looks at,
+        so we can tell cheaply if a re-scraped announce has changed"""
+        values = [getattr(self, k, None) for k in UPDATED_ATTRIBUTES + ['native_picture_url']]
+        s = json.dumps(values, default=str)
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
     def update(self, item, obj):
         """Take an updated scrapedobject for this item and see if anything relevant
         (title, description, price, etc) has changed. If so, update the item
@@ -253,16 +281,7 @@ class BDLItem():
         updated = False
         update_picture = False
 
-        # These are the attributes to update in the item if they have changed
-        # NOTE: we should absolutly not update the native_url
-        attributes = [
-            'title', 'description', 'price', 'currency', 'language', 'country',
-            'location', 'price_is_fixed', 'native_doc_id', 'native_seller_id',
-            'native_seller_name', 'native_seller_is_shop', 'native_group_id',
-            'native_location',
-        ]
-
-        for k in attributes:
+        for k in UPDATED_ATTRIBUTES:
             if hasattr(obj, k) and getattr(obj, k):
                 if not hasattr(self, k) or (hasattr(self, k) and getattr(self, k) != getattr(obj, k)):
                     log.info("Updating Item %s" % k)
@@ -331,47 +350,68 @@ class BDLItem():
 
     def pass_curator(self, ignore_whitelist=False, skip_sold=True):
         """Curate an announce, based on simple heuristics"""
+        verdict = self.curate(ignore_whitelist=ignore_whitelist, skip_sold=skip_sold)
+        return verdict.passed
+
+
+    def curate(self, ignore_whitelist=False, skip_sold=True):
+        """Curate an announce and return a CurationVerdict telling whether it
+        passed, and which category, list and keyword decided of it"""
 
         log.info("Curating '%s'" % self.title)
 
         text = self.get_text()
 
-        # If no language is specified, use amazon comprehend to identify the
-        # announce's language. We need the language to match against keyword
-        # lists
+        # If no language is specified, identify the announce's language. We
+        # need the language to match against keyword lists
         if not self.language:
             self.identify_language()
             log.info("Identified announce's language: %s [%s]" % (self.language, str(self)))
 
-        if skip_sold and self.seems_sold():
-            return False
+        # Match the text against all curation lists at once
+        matches = get_curation_lists().match(text, self.language)
+
+        if skip_sold and matches.match(SOLD):
+            log.debug("Announce seems sold")
+            return CurationVerdict(False, 'SOLD', list_name=SOLD.name, keyword=matches.get_keyword(SOLD))
 
         # TODO: check if we have already parsed and rejected this announce
         # earlier on by matching native_url against a cache of recently
         # rejected native_urls
 
-        if BLACKLIST_ALL.match(text, self.language):
+        if matches.match(BLACKLIST_ALL):
             log.debug("Announce fails global blacklist check")
-            return False
+            return CurationVerdict(False, 'BLACKLISTED', list_name=BLACKLIST_ALL.name, keyword=matches.get_keyword(BLACKLIST_ALL))
 
+        rejections = {}
         for cat in get_categories():
             # cat has attributes whitelist, blacklist, prices and name
             if not self.has_ok_price(price_ranges=cat.prices):
                 log.debug("Announce fails price check on category %s" % cat.name)
+                rejections[cat.name] = 'PRICE'
                 continue
-            elif cat.blacklist.match(text, self.language):
+            elif matches.match(cat.blacklist):
                 log.debug("Announce fails blacklist check on category %s" % cat.name)
+                rejections[cat.name] = 'BLACKLIST'
                 continue
-            elif not ignore_whitelist and not cat.whitelist.match(text, self.language):
+            elif not ignore_whitelist and not matches.match(cat.whitelist):
                 log.debug("Announce fails whitelist check on category %s" % cat.name)
+                rejections[cat.name] = 'WHITELIST'
                 continue
 
             # Yipii! Announce passes all checks on this category
             log.debug("Announce passes all checks on category %s" % cat.name)
-            return True
+            return CurationVerdict(
+                True,
+                'PASSED',
+                category=cat.name,
+                list_name=None if ignore_whitelist else cat.whitelist.name,
+                keyword=None if ignore_whitelist else matches.get_keyword(cat.whitelist),
+                rejections=rejections,
+            )
 
         # No category matches...
-        return False
+        return CurationVerdict(False, 'NO_CATEGORY', rejections=rejections)
 
     # ----------------------------------------
     #
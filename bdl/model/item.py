@@ -4,8 +4,10 @@ import dateutil.parser
 from uuid import uuid4
 from pymacaron_core.swagger.apipool import ApiPool
 from pymacaron.utils import to_epoch, timenow
-from pymacaron_dynamodb import get_dynamodb
+from bdl.io.dynamodb import get_table
 from bdl.db.elasticsearch import es_index_doc_async, es_index_doc, es_delete_doc
+from bdl.db.elasticsearch import es_update_doc, es_update_doc_async
+from bdl.db.elasticsearch import get_bulk_indexer
 from bdl.utils import mixin
 
 
@@ -23,20 +25,20 @@ def model_to_item(o):
     elif o.topmodel:
         raise Exception('model_to_topmodel not implemented')
 
-    # Monkey patch __str__
-    def str(self):
-        subitem = ": %s" % self.get_subitem() if hasattr(self, 'get_subitem') else ''
-        return "<Item %s%s>" % (
+
+class Item():
+
+    __slots__ = ()
+
+    def __str__(self):
+        return "<Item %s: %s>" % (
             self.item_id,
-            subitem,
+            self.get_subitem(),
         )
 
-    o.__class__.__str__ = str
-    o.__class__.__repr__ = str
-    o.__class__.__unicode__ = str
-
+    __repr__ = __str__
+    __unicode__ = __str__
 
-class Item():
 
     def get_subitem(self):
         """Return the scraped object stored in this item"""
@@ -48,7 +50,9 @@ class Item():
 
 
     def set_item_id(self):
-        """Find an item_id that is not already taken"""
+        """Generate a new item_id, made of the source's prefix and 80 random
+        bits. That is enough to never collide with an existing item_id, so we
+        don't need to check in the item tables that it is free"""
 
         assert self.source
 
@@ -64,15 +68,25 @@ class Item():
         }
 
         log.debug("item source: %s" % self.source)
-        from bdl.db.item import item_exists
-        while not self.item_id:
-            item_id = '%s-%s' % (
+        if not self.item_id:
+            self.item_id = '%s-%s' % (
                 source_to_prefix[self.source],
-                str(uuid4()).replace('-', '')[0:10],
+                uuid4().hex[0:20],
             )
-            if not item_exists(item_id):
-                log.debug("Generated item_id=%s" % item_id)
-                self.item_id = item_id
+            log.debug("Generated item_id=%s" % self.item_id)
+
+
+    def get_fingerprint(self):
+        """Return the fingerprint of the announce this item was last updated
+        from, or None. It is stored along with the item in DynamoDB, but is not
+        a property of the Item model, so it stays out of API responses and
+        elasticsearch documents"""
+        return vars(self).get('_fingerprint')
+
+
+    def set_fingerprint(self, fingerprint):
+        # Model.__setattr__ would store it as a property of the model
+        object.__setattr__(self, '_fingerprint', fingerprint)
 
 
     def regenerate(self, update_picture=False, async=False):
@@ -96,6 +110,11 @@ class Item():
 
         log.debug("Archiving item %s (%s)" % (self.item_id, self.slug))
 
+        # Store first the views of this item pending in this process, so they
+        # get archived with it
+        from bdl.db.views import flush_item_views
+        flush_item_views(self)
+
         archiveditem = ApiPool.api.model.ArchivedItem(
             **ApiPool.api.model_to_json(self)
         )
@@ -106,11 +125,14 @@ class Item():
         # but that breaks database persistence (save_to_db() is not monkey patched...)
         archiveditem.date_created = dateutil.parser.parse(archiveditem.date_created)
         archiveditem.date_last_check = dateutil.parser.parse(archiveditem.date_last_check)
+        archiveditem.set_fingerprint(self.get_fingerprint())
         archiveditem.save_to_db(async=False)
 
         # Remove from dynamodb
-        table = get_dynamodb().Table('items')
+        table = get_table('items')
         table.delete_item(Key={'item_id': self.item_id})
+        from bdl.db.item import get_item_cache
+        get_item_cache().invalidate(self.item_id)
 
         # And remove from elasticsearch
         es_delete_doc(
@@ -123,16 +145,36 @@ class Item():
 
 
     def update(self, newsubitem):
+        # If the re-scraped announce has not changed, just record that we
+        # checked it
+        fingerprint = newsubitem.get_fingerprint()
+        if self.get_fingerprint() == fingerprint:
+            log.debug("Item %s is unchanged" % self.item_id)
+            self.mark_as_checked()
+            return
+
         log.debug("Updating and saving item %s" % self.item_id)
         self.get_subitem().update(self, newsubitem)
+        self.set_fingerprint(fingerprint)
         self.date_last_check = timenow()
         self.save_to_db(async=False)
 
 
+    def mark_as_checked(self):
+        """Set this item's date_last_check to now, with partial updates of its
+        record in DynamoDB and of its elasticsearch document instead of
+        rewriting them"""
+        self.date_last_check = timenow()
+        from bdl.db.item import store_date_last_check
+        store_date_last_check(self)
+
+
 class IndexableItem():
 
+    __slots__ = ()
+
     def get_es_doc_type(self):
-        return self.get_subitem().doc_type(),
+        return self.get_subitem().doc_type()
 
 
     def get_es_index(self):
@@ -156,7 +198,8 @@ class IndexableItem():
             doc['free_search'],
         ))
 
-        f = es_index_doc_async if async else es_index_doc
+        # Documents queued up in a bulk indexer are indexed by its flush
+        f = es_index_doc_async if async and not get_bulk_indexer() else es_index_doc
         r = f(
             self.get_es_index(),
             doc,
@@ -167,6 +210,18 @@ class IndexableItem():
         return r
 
 
+    def update_in_es(self, doc, asynchronous=False):
+        """Update only the attributes in doc of this item's elasticsearch
+        document"""
+        f = es_update_doc_async if asynchronous and not get_bulk_indexer() else es_update_doc
+        f(
+            self.get_es_index(),
+            doc,
+            self.get_es_doc_type(),
+            self.item_id,
+        )
+
+
 def create_item(sobj, index=None, source=None, real=False):
     """Take a ScrappedObject and generate an Item, save and return it"""
 
@@ -199,6 +254,7 @@ def create_item(sobj, index=None, source=None, real=False):
     item.date_created = now
     item.date_last_check = now
     item.count_views = 0
+    item.set_fingerprint(sobj.get_subitem().get_fingerprint())
 
     item.set_item_id()
 
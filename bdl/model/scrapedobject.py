@@ -21,19 +21,20 @@ def model_to_scraped_object(o):
     elif o.topmodel:
         raise Exception('model_to_topmodel not implemented')
 
-    # Monkey patch __str__
-    def str(self):
-        subitem = " %s " % self.get_subitem() if hasattr(self, 'get_subitem') else ''
-        return '<ScrapedObject %s%s>' % (
+
+class ScrapedObject():
+
+    __slots__ = ()
+
+    def __str__(self):
+        return '<ScrapedObject %s %s >' % (
             self.native_url,
-            subitem,
+            self.get_subitem(),
         )
-    o.__class__.__str__ = str
-    o.__class__.__repr__ = str
-    o.__class__.__unicode__ = str
 
+    __repr__ = __str__
+    __unicode__ = __str__
 
-class ScrapedObject():
 
     def get_subitem(self):
         if self.bdlitem:
@@ -10,12 +10,13 @@ log = logging.getLogger(__name__)
 
 DIR_NODES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etc', 'nodes')
 
+WORD_SEPARATORS = re.compile(r'[%s%s%s]+' % (re.escape(string.punctuation), string.digits, string.whitespace))
+
 
 def text_to_words(s):
     """Take a unicode encoded text and split it into a list of words"""
     s = s.lower()
-    regex = re.compile(r'[%s%s%s]+' % (re.escape(string.punctuation), string.digits, string.whitespace))
-    l = regex.split(s)
+    l = WORD_SEPARATORS.split(s)
     l = [ss for ss in l if ss]
     return l
 
@@ -53,6 +54,51 @@ class Keyword:
         return '%s[%s]' % (self.word, self.language if self.language else '')
 
 
+class KeywordTrie:
+    """A trie of keywords, indexed word by word, used to find all the keywords
+    matching a text in one pass over its words instead of one substring search
+    per keyword. Each keyword is stored together with a value (the node or
+    list it belongs to) and matches exactly when Keyword.match() would.
+
+    A text must be split into words with ' ' as the only separator, the same
+    way keywords are, for matches to be identical to Keyword.match().
+    """
+
+    def __init__(self):
+        # One trie per keyword language, plus one (under None) for keywords
+        # matching all languages
+        self.roots = {}
+
+    def add(self, keyword, value):
+        assert type(keyword) is Keyword
+        n = self.roots.setdefault(keyword.language, {})
+        for w in keyword.word.split(' '):
+            n = n.setdefault(w, {})
+        # None is never a word, so it can safely mark the end of keywords
+        n.setdefault(None, []).append((keyword, value))
+
+    def match(self, words, language):
+        """Return the set of (keyword, value) matching this list of words"""
+        assert language
+
+        roots = [r for r in (self.roots.get(None), self.roots.get(language)) if r]
+
+        matches = set()
+        count = len(words)
+        for i in range(count):
+            for root in roots:
+                n = root.get(words[i])
+                j = i + 1
+                while n is not None:
+                    if None in n:
+                        matches.update(n[None])
+                    if j == count:
+                        break
+                    n = n.get(words[j])
+                    j = j + 1
+        return matches
+
+
 class KeywordList:
     """A list of keywords to match against any text. The keywords are parsed from
     a file, which may optionally contain the following header attributes:
@@ -104,6 +150,20 @@ class KeywordList:
                 if l:
                     self.keywords.append(Keyword(l))
 
+        # Index all keywords by their words, keeping track of their position
+        # in the list
+        self.trie = KeywordTrie()
+        for i, w in enumerate(self.keywords):
+            self.trie.add(w, i)
+
+    def get_matching_keywords(self, text, language):
+        """Return all keywords matching this text, in the order of the list"""
+        assert text is not None
+        assert language
+        words = text.lower().split(' ')
+        positions = sorted([i for w, i in self.trie.match(words, language)])
+        return [self.keywords[i] for i in positions]
+
     def match(self, text, language):
         assert language
         # log.debug("Matching [%s]/[%s] against %s" % (language, text, self))
@@ -193,6 +253,7 @@ class Tree:
 
     def __init__(self):
         self.all_nodes = {}
+        self.trie = KeywordTrie()
 
     def get_all_nodes(self):
         return self.all_nodes.values()
@@ -289,6 +350,17 @@ class Tree:
             # log.debug("Node %s has paths %s" % (node, ' '.join([str(p) for p in paths])))
             node.set_paths(paths)
 
+        # Step 5: compile all node keywords into one trie, to match them all
+        # in one pass over a text's words
+        self.trie = KeywordTrie()
+        for node in self.all_nodes.values():
+            for w in node.keywords:
+                self.trie.add(w, node)
+
+    def get_matching_nodes(self, words, language):
+        """Return all the nodes with a keyword matching this list of words"""
+        return set([node for w, node in self.trie.match(words, language)])
+
 
 tree = Tree()
 tree.load()
@@ -305,10 +377,8 @@ def get_matching_tags(text, language):
 
     # log.debug('TAG MATCHER: Finding tags matching [%s..]' % (text[0:10]))
 
-    # First, split the text into words for exact word matching,
-    # then back into a string
+    # First, split the text into words for exact word matching
     words = text_to_words(text)
-    text = ' '.join(words)
 
     # We'll keep track of paths and tags
     paths = set()
@@ -319,13 +389,12 @@ def get_matching_tags(text, language):
     }
 
     # Find all nodes
-    for node in tree.get_all_nodes():
-        if node.match(text, language):
-            # log.debug('TAG MATCHER: Text [%s] matches node %s' % (text[0:10], node))
-            matching_nodes[node.name] = node
-            if node.grants:
-                for n in node.grants:
-                    matching_nodes[n.name] = n
+    for node in tree.get_matching_nodes(words, language):
+        # log.debug('TAG MATCHER: Text [%s] matches node %s' % (text[0:10], node))
+        matching_nodes[node.name] = node
+        if node.grants:
+            for n in node.grants:
+                matching_nodes[n.name] = n
 
     # log.debug('TAG MATCHER: Text [%s..] matches NODE: %s' % (text[0:10], ' '.join([str(n) for n in matching_nodes.values()])))
 
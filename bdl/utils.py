@@ -1,5 +1,5 @@
 import logging
-import types
+import threading
 import re
 from pymacaron.auth import generate_token
 from html.parser import HTMLParser
@@ -8,14 +8,35 @@ from html.parser import HTMLParser
 log = logging.getLogger(__name__)
 
 
-def mixin(o, *args):
-    """Monkey patch all methods from class cls into instance o"""
-    # See: https://filippo.io/instance-monkey-patching-in-python/
+# (model class, mixin classes...) -> mixed class
+mixed_classes = {}
+mixed_classes_lock = threading.Lock()
 
-    for cls in args:
-        methods = [m for m in dir(cls) if not m.startswith('__')]
-        for m in methods:
-            setattr(o, m, types.MethodType(getattr(cls, m), o))
+def mixin(o, *args):
+    """Give instance o all the methods of the classes in args, by changing its
+    class into a subclass of those classes and of its own class. Methods of
+    the classes in args take precedence. That subclass keeps the name of o's
+    class, and is generated only once per model class.
+
+    The classes in args must declare empty __slots__, so that the subclass
+    keeps the memory layout of the model class, and the class is set with
+    object.__setattr__() since bravado models store every attribute set on
+    them as a property."""
+
+    base = o.__class__
+    if all([issubclass(base, cls) for cls in args]):
+        return
+
+    key = (base, ) + args
+    c = mixed_classes.get(key)
+    if not c:
+        with mixed_classes_lock:
+            c = mixed_classes.get(key)
+            if not c:
+                c = type(base)(base.__name__, args + (base, ), {'__module__': base.__module__, '__slots__': ()})
+                mixed_classes[key] = c
+
+    object.__setattr__(o, '__class__', c)
 
 
 def gen_jwt_token(type='www', scrapper=None, language='en'):
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import os
+import sys
+import types
+import time
+import logging
+import click
+from pymacaron_core.swagger.apipool import ApiPool
+
+
+logging.disable(logging.CRITICAL)
+
+
+PATH_LIBS = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.append(PATH_LIBS)
+
+from bdl.formats import get_custom_formats
+from bdl.model.item import Item, IndexableItem, model_to_item
+from bdl.model.bdlitem import BDLItem
+from bdl.api.search import doc_to_item
+
+
+DOC = {
+    '_source': {
+        'item_id': 'tst-1234567890',
+        'index': 'BDL',
+        'real': False,
+        'source': 'TEST',
+        'native_url': 'https://bdl.com/test1',
+        'slug': 'louis-vuitton_1000_SEK__tst-1234567890',
+        'count_views': 12,
+        'display_priority': 1,
+        'searchable_string': 'louis vuitton a nice bag',
+        'date_created': '2018-10-01T12:00:00+00:00',
+        'date_last_check': '2018-10-02T12:00:00+00:00',
+        'bdlitem': {
+            'title': 'Louis Vuitton',
+            'description': 'A nice bag',
+            'country': 'SE',
+            'language': 'en',
+            'price': 1000,
+            'price_is_fixed': False,
+            'currency': 'SEK',
+            'has_ended': False,
+            'tags': ['LOUISVUITTON', 'BAGS'],
+            'picture_tags': [],
+            'native_picture_url': 'https://img.bazardelux.com/cat2.jpg',
+        },
+    },
+}
+
+
+def legacy_mixin(o, *args):
+    """The former bdl.utils.mixin(), binding every method onto the instance"""
+    for cls in args:
+        methods = [m for m in dir(cls) if not m.startswith('__')]
+        for m in methods:
+            setattr(o, m, types.MethodType(getattr(cls, m), o))
+
+
+def legacy_model_to_item(item):
+    legacy_mixin(item, Item, IndexableItem)
+    legacy_mixin(item.bdlitem, BDLItem)
+
+
+def legacy_doc_to_item(doc):
+    item = ApiPool.api.json_to_model('Item', doc['_source'])
+    legacy_model_to_item(item)
+    return item
+
+
+def validated_doc_to_item(doc):
+    """doc_to_item() before it skipped validation"""
+    item = ApiPool.api.json_to_model('Item', doc['_source'])
+    model_to_item(item)
+    return item
+
+
+def bench(name, f, count, setup=None):
+    """Print the best time per document of f over a few runs"""
+    times = []
+    for i in range(5):
+        args = setup() if setup else None
+        t0 = time.perf_counter()
+        f(args)
+        times.append(time.perf_counter() - t0)
+    print("%-24s %8.1f usec/doc" % (name, min(times) * 1000000 / count))
+
+
+@click.command()
+@click.option('--count', default=1000, metavar='N', help="Number of documents to convert per run")
+def main(count):
+    """Compare the time it takes to convert elasticsearch documents into Items:
+    with per-instance monkey patching or cached mixed classes, and with
+    validating or trusting documents, for single documents and for a search
+    page of 50 hits
+
+    """
+
+    ApiPool.add(
+        'api',
+        yaml_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apis', 'api.yaml'),
+        formats=get_custom_formats(),
+    )
+
+    # Convert each way once before timing, to generate all classes
+    item = doc_to_item(DOC)
+    legacy_item = legacy_doc_to_item(DOC)
+    assert item.get_subitem().get_slug(item.item_id) == legacy_item.get_subitem().get_slug(item.item_id)
+
+    def models():
+        return [ApiPool.api.json_to_model('Item', DOC['_source']) for i in range(count)]
+
+    def convert(f):
+        def g(items):
+            for i in items:
+                f(i)
+        return g
+
+    bench('legacy model_to_item', convert(legacy_model_to_item), count, setup=models)
+    bench('model_to_item', convert(model_to_item), count, setup=models)
+    bench('legacy doc_to_item', lambda x: [legacy_doc_to_item(DOC) for i in range(count)], count)
+    bench('validated doc_to_item', lambda x: [validated_doc_to_item(DOC) for i in range(count)], count)
+    bench('doc_to_item', lambda x: [doc_to_item(DOC) for i in range(count)], count)
+
+    # A search page, serialized as in the response
+    page = [DOC] * 50
+
+    def search_page(f):
+        def g(x):
+            for i in range(count // 50):
+                ApiPool.api.model_to_json(ApiPool.api.model.SearchedItems(items=[f(d) for d in page]))
+        return g
+
+    bench('50 hits, legacy', search_page(legacy_doc_to_item), count)
+    bench('50 hits, validated', search_page(validated_doc_to_item), count)
+    bench('50 hits, doc_to_item', search_page(doc_to_item), count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import os
+import sys
+import logging
+import click
+
+
+PATH_LIBS = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.append(PATH_LIBS)
+
+from bdl.db.elasticsearch import es_put_item_template
+
+
+log = logging.getLogger(__name__)
+
+
+@click.command()
+def main():
+    """Install the index template mapping source, country, currency, tags and
+    real as keyword fields of the bdlitems indexes. Only indexes created
+    afterwards use it: existing indexes already have dynamically mapped
+    keyword subfields for them.
+
+    """
+    logging.basicConfig(level=logging.INFO)
+    es_put_item_template()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import logging
+from unittest import TestCase
+from bdl.categories import get_categories, get_curation_lists, CurationVerdict
+from bdl.categories import SOLD, BLACKLIST_ALL
+
+
+log = logging.getLogger(__name__)
+
+
+class Test(TestCase):
+
+    def assertSameMatches(self, text, language):
+        lists = [SOLD, BLACKLIST_ALL]
+        for cat in get_categories():
+            lists = lists + [cat.blacklist, cat.whitelist]
+
+        matches = get_curation_lists().match(text, language)
+        for kwl in lists:
+            self.assertEqual(
+                matches.match(kwl),
+                kwl.match(text, language),
+                "Curation lists and list %s disagree on [%s][%s]" % (kwl.name, language, text)
+            )
+            if matches.match(kwl):
+                self.assertEqual(matches.get_keyword(kwl), kwl.get_matching_keywords(text, language)[0])
+            else:
+                self.assertEqual(matches.get_keyword(kwl), None)
+
+
+    def test_curation_lists(self):
+        tests = [
+            ['en', 'Gucci bag, sold'],
+            ['en', ' Gucci bag sold '],
+            ['sv', ' Antik karmstol  Carl Malmsten, s&aring;ld '],
+            ['sv', ' Louis Vuitton väska från ikea '],
+            ['sv', ' party tavla av Carl Larsson '],
+            ['en', ' an unsold louis vuitton bag '],
+        ]
+
+        for language, text in tests:
+            self.assertSameMatches(text, language)
+
+        matches = get_curation_lists().match(' babar sold his pants ', 'en')
+        self.assertTrue(matches.match(SOLD))
+        self.assertEqual(matches.get_keyword(SOLD).word, 'sold')
+        self.assertFalse(matches.match(BLACKLIST_ALL))
+
+        matches = get_curation_lists().match(' babar sold his pants ', 'sv')
+        self.assertFalse(matches.match(SOLD))
+
+
+    def test_curation_verdict(self):
+        v = CurationVerdict(True, 'PASSED', category='art', list_name='art-whitelist', keyword='carl larsson')
+        self.assertEqual(str(v), "<CurationVerdict PASSED category=art list=art-whitelist keyword=carl larsson>")
+        self.assertEqual(v.rejections, {})
+
+        v = CurationVerdict(False, 'NO_CATEGORY', rejections={'mode': 'PRICE'})
+        self.assertEqual(str(v), "<CurationVerdict NO_CATEGORY>")
+        self.assertEqual(v.rejections, {'mode': 'PRICE'})
@@ -0,0 +1,98 @@
+import time
+import logging
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from bdl.io.comprehend import LanguageResolver, identify_language
+from bdl.io.comprehend import set_language_resolver, LanguageCache
+
+
+log = logging.getLogger(__name__)
+
+
+def batch_detect_dominant_language(TextList=None):
+    # Fail on texts starting with '!', identify the others as english
+    return {
+        'ResultList': [
+            {'Index': i, 'Languages': [{'Score': 0.2, 'LanguageCode': 'fr'}, {'Score': 0.8, 'LanguageCode': 'en'}]}
+            for i, t in enumerate(TextList) if not t.startswith('!')
+        ],
+        'ErrorList': [
+            {'Index': i, 'ErrorCode': 'INTERNAL_SERVER_ERROR', 'ErrorMessage': 'Oops'}
+            for i, t in enumerate(TextList) if t.startswith('!')
+        ],
+    }
+
+
+class Tests(TestCase):
+
+    def test_language_resolver(self):
+        comprehend = MagicMock()
+        comprehend.batch_detect_dominant_language.side_effect = batch_detect_dominant_language
+        comprehend.detect_dominant_language.return_value = {
+            'Languages': [{'Score': 0.9, 'LanguageCode': 'sv'}],
+        }
+
+        texts = ['text %s' % i for i in range(60)] + ['!error', 'text 1', 'cached']
+
+        cache = LanguageCache()
+        cache.set('cached', 'it')
+
+        with patch('bdl.io.comprehend.get_comprehend', return_value=comprehend), \
+             patch('bdl.io.comprehend.get_language_cache', return_value=cache):
+            resolver = LanguageResolver()
+            resolver.prefetch(texts)
+
+            # 61 distinct uncached texts, 25 per call
+            self.assertEqual(comprehend.batch_detect_dominant_language.call_count, 3)
+            self.assertEqual(resolver.get('cached'), 'it')
+            self.assertEqual(resolver.get('text 59'), 'en')
+            self.assertEqual(resolver.get('!error'), None)
+
+            set_language_resolver(resolver)
+            try:
+                self.assertEqual(identify_language('text 0'), 'en')
+                self.assertEqual(comprehend.detect_dominant_language.call_count, 0)
+
+                # Texts that failed in batch are identified one by one
+                self.assertEqual(identify_language('!error'), 'sv')
+                self.assertEqual(identify_language('other text'), 'sv')
+                self.assertEqual(comprehend.detect_dominant_language.call_count, 2)
+            finally:
+                set_language_resolver(None)
+
+            # Without resolver, languages come from the cache
+            self.assertEqual(identify_language('text 0'), 'en')
+            self.assertEqual(identify_language('other text'), 'sv')
+            self.assertEqual(comprehend.detect_dominant_language.call_count, 2)
+            self.assertEqual(identify_language('yet another text'), 'sv')
+            self.assertEqual(comprehend.detect_dominant_language.call_count, 3)
+
+
+    def test_language_resolver_batch_failure(self):
+        comprehend = MagicMock()
+        comprehend.batch_detect_dominant_language.side_effect = Exception('Throttled')
+
+        with patch('bdl.io.comprehend.get_comprehend', return_value=comprehend), \
+             patch('bdl.io.comprehend.get_language_cache', return_value=LanguageCache()):
+            resolver = LanguageResolver()
+            resolver.prefetch(['text 1', 'text 2'])
+            self.assertEqual(resolver.get('text 1'), None)
+
+
+    def test_language_cache(self):
+        cache = LanguageCache(maxsize=2, ttl=60)
+        cache.set('a', 'en')
+        cache.set('b', 'sv')
+        self.assertEqual(cache.get('a'), 'en')
+
+        # 'b' is the least recently used entry
+        cache.set('c', 'fr')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 'en', 'c': 'fr'})
+
+        self.assertEqual(cache.get_stats(), {'size': 2, 'hits': 3, 'db_hits': 0, 'misses': 2})
+
+        # Entries expire after ttl seconds
+        with patch('bdl.io.comprehend.time.time', return_value=time.time() + 61):
+            self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get_stats()['size'], 1)
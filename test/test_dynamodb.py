@@ -0,0 +1,33 @@
+import logging
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from bdl.io.dynamodb import get_dynamodb, get_table
+
+
+log = logging.getLogger(__name__)
+
+
+class Tests(TestCase):
+
+    def test_get_table_per_thread(self):
+        tables = {}
+
+        def lookup(name):
+            table = get_table('items')
+            tables[name] = (get_dynamodb(), table, get_table('items') is table)
+
+        with patch('bdl.io.dynamodb.get_config'), \
+             patch('bdl.io.dynamodb.boto3.session.Session', side_effect=lambda **kwargs: MagicMock()):
+            for name in ('t1', 't2'):
+                t = threading.Thread(target=lookup, args=(name, ))
+                t.start()
+                t.join()
+
+        # Each thread gets its own resource and tables
+        self.assertTrue(tables['t1'][0] is not tables['t2'][0])
+        self.assertTrue(tables['t1'][1] is not tables['t2'][1])
+
+        # And reuses its tables
+        self.assertTrue(tables['t1'][2])
+        self.assertTrue(tables['t2'][2])
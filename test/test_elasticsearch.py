@@ -0,0 +1,130 @@
+import json
+import logging
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from bdl.db.elasticsearch import ESBulkIndexer, get_bulk_indexer, es_index_doc, es_delete_doc
+from bdl.db.elasticsearch import get_refresh_policy, es_search_index
+
+
+log = logging.getLogger(__name__)
+
+
+def mock_es(items=None):
+    es = MagicMock()
+    es.transport.serializer.dumps = json.dumps
+    es.bulk.return_value = {
+        'errors': True if items else False,
+        'items': items if items else [],
+    }
+    return es
+
+
+class Tests(TestCase):
+
+    def test_bulk_flush_on_exit(self):
+        es = mock_es()
+        with patch('bdl.db.elasticsearch.get_es', return_value=es):
+            with ESBulkIndexer() as bulk:
+                self.assertEqual(get_bulk_indexer(), bulk)
+                es_index_doc('bdlitems-test', {'title': 'a'}, 'BDL_ITEM', 'tst-1')
+                es_delete_doc('bdlitems-test', 'BDL_ITEM', 'tst-2')
+                self.assertEqual(es.bulk.call_count, 0)
+                self.assertEqual(es.index.call_count, 0)
+                self.assertEqual(es.delete.call_count, 0)
+
+            self.assertEqual(get_bulk_indexer(), None)
+            self.assertEqual(es.bulk.call_count, 1)
+
+            body = es.bulk.call_args[1]['body']
+            lines = [json.loads(l) for l in body.strip().split('\n')]
+            self.assertEqual(lines, [
+                {'index': {'_index': 'bdlitems-test', '_type': 'BDL_ITEM', '_id': 'tst-1'}},
+                {'title': 'a', 'uid': 'tst-1'},
+                {'delete': {'_index': 'bdlitems-test', '_type': 'BDL_ITEM', '_id': 'tst-2'}},
+            ])
+            self.assertEqual(bulk.errors, {})
+
+
+    def test_bulk_flush_on_count(self):
+        es = mock_es()
+        with patch('bdl.db.elasticsearch.get_es', return_value=es):
+            bulk = ESBulkIndexer(max_actions=2)
+            for i in range(5):
+                bulk.index('bdlitems-test', {'title': 'a'}, 'BDL_ITEM', 'tst-%s' % i)
+            self.assertEqual(es.bulk.call_count, 2)
+            bulk.flush()
+            self.assertEqual(es.bulk.call_count, 3)
+            bulk.flush()
+            self.assertEqual(es.bulk.call_count, 3)
+
+
+    def test_bulk_errors(self):
+        es = mock_es(items=[
+            {'index': {'_id': 'tst-1', 'status': 201}},
+            {'index': {'_id': 'tst-2', 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}},
+            {'delete': {'_id': 'tst-3', 'status': 404, 'error': 'not_found'}},
+        ])
+        with patch('bdl.db.elasticsearch.get_es', return_value=es), patch('bdl.db.elasticsearch.report_error'):
+            bulk = ESBulkIndexer()
+            bulk.index('bdlitems-test', {'title': 'a'}, 'BDL_ITEM', 'tst-1')
+            bulk.index('bdlitems-test', {'title': 'b'}, 'BDL_ITEM', 'tst-2')
+            bulk.delete('bdlitems-test', 'BDL_ITEM', 'tst-3')
+            errors = bulk.flush()
+            self.assertEqual(errors, {'tst-2': {'type': 'mapper_parsing_exception'}})
+            self.assertEqual(bulk.errors, errors)
+
+
+    def test_get_refresh_policy(self):
+        self.assertEqual(get_refresh_policy(True), 'true')
+        self.assertEqual(get_refresh_policy(False), 'false')
+        self.assertEqual(get_refresh_policy('none'), 'false')
+        self.assertEqual(get_refresh_policy('wait_for'), 'wait_for')
+        with self.assertRaises(AssertionError):
+            get_refresh_policy('later')
+
+        conf = MagicMock(es_refresh='wait_for', es_bulk_refresh=False)
+        with patch('bdl.db.elasticsearch.get_config', return_value=conf):
+            self.assertEqual(get_refresh_policy(), 'wait_for')
+            self.assertEqual(get_refresh_policy(setting='es_bulk_refresh'), 'false')
+            self.assertEqual(get_refresh_policy(True, setting='es_bulk_refresh'), 'true')
+            self.assertEqual(ESBulkIndexer().refresh, 'false')
+            self.assertEqual(ESBulkIndexer(refresh='true').refresh, 'true')
+
+        conf = MagicMock(es_refresh=None)
+        with patch('bdl.db.elasticsearch.get_config', return_value=conf):
+            self.assertEqual(get_refresh_policy(), 'true')
+
+
+    def test_search_with_filters(self):
+        es = mock_es()
+        es.search.return_value = {'hits': {'hits': [], 'total': 0}}
+        with patch('bdl.db.elasticsearch.get_es', return_value=es):
+            es_search_index(
+                index_name='bdlitems-live',
+                doc_type='BDL_ITEM',
+                query='louis vuitton',
+                filters={'source': 'TRADERA', 'tags': ['BAGS', 'LOUISVUITTON'], 'real': True},
+                page=1,
+                item_per_page=20,
+            )
+
+        body = es.search.call_args[1]['body']
+        self.assertEqual(body['from'], 20)
+        self.assertEqual(body['query'], {
+            'bool': {
+                'must': {'match': {'free_search': {'query': 'louis vuitton', 'operator': 'and'}}},
+                'filter': [
+                    {'term': {'real': True}},
+                    {'term': {'source.keyword': 'TRADERA'}},
+                    {'terms': {'bdlitem.tags.keyword': ['BAGS', 'LOUISVUITTON']}},
+                ],
+            }
+        })
+
+
+    def test_search_without_filters(self):
+        es = mock_es()
+        es.search.return_value = {'hits': {'hits': [], 'total': 0}}
+        with patch('bdl.db.elasticsearch.get_es', return_value=es):
+            es_search_index(index_name='bdlitems-live', doc_type='BDL_ITEM', page=0, item_per_page=1)
+        self.assertEqual(es.search.call_args[1]['body']['query'], {'match_all': {}})
@@ -1,7 +1,14 @@
 import os
 import logging
+from decimal import Decimal
 from pymacaron_core.swagger.apipool import ApiPool
-from bdl.model.item import model_to_item
+from unittest.mock import patch, MagicMock
+from bdl.model.item import Item, model_to_item
+from bdl.model.bdlitem import model_to_bdlitem
+from bdl.db.item import NativeUrlResolver, get_item_by_native_url, set_native_url_resolver
+from bdl.db.item import update_item_attributes, get_item, ItemCache
+from bdl.db.item import store_item, load_from_table, PersistentItem
+from bdl.exceptions import ItemNotFoundError
 from bdl.formats import get_custom_formats
 from unittest import TestCase
 
@@ -37,6 +44,31 @@ class Tests(TestCase):
         self.assertEqual(str(i), "<Item tst-1234: <BDLItem 'And a very long titl..' 12 SEK>>")
 
 
+    def test_model_to_item(self):
+        for model_name in ('Item', 'ArchivedItem'):
+            i = getattr(ApiPool.api.model, model_name)(
+                item_id='tst-1234',
+                bdlitem=ApiPool.api.model.BDLItem(title='foo'),
+            )
+            model_to_item(i)
+
+            # The model's class is swapped, and the item gets its methods
+            self.assertEqual(i.__class__.__name__, model_name)
+            self.assertTrue(isinstance(i, Item))
+            self.assertEqual(i.get_subitem().title, 'foo')
+            self.assertEqual(i.get_subitem().index_name(), 'bdlitems')
+
+            # Without the class ending up in the item's json
+            j = ApiPool.api.model_to_json(i)
+            self.assertTrue('__class__' not in j)
+            self.assertEqual(j['item_id'], 'tst-1234')
+
+            # Items are mixed only once
+            c = i.__class__
+            model_to_item(i)
+            self.assertTrue(i.__class__ is c)
+
+
     def test_set_item_id(self):
         i = ApiPool.api.model.Item()
         model_to_item(i)
@@ -45,7 +77,7 @@ class Tests(TestCase):
         self.assertEqual(i.item_id, None)
         i.set_item_id()
         self.assertTrue(i.item_id.startswith('tst-'))
-        self.assertEqual(len(i.item_id), 14)
+        self.assertEqual(len(i.item_id), 24)
 
         i.item_id = None
         i.source = 'BLOCKET'
@@ -61,3 +93,190 @@ class Tests(TestCase):
         i.source = 'TEST'
         i.set_item_id()
         self.assertFalse(i.item_id.startswith('tst-'))
+
+
+    def test_native_url_resolver(self):
+        queried = []
+
+        def query(native_url):
+            queried.append(native_url)
+            return 'item:%s' % native_url if native_url.endswith('1') else None
+
+        with patch('bdl.db.item.query_item_by_native_url', side_effect=query):
+            r = NativeUrlResolver()
+            r.prefetch(['https://bdl.com/test1', 'https://bdl.com/test2', 'https://bdl.com/test1', None])
+            self.assertEqual(sorted(queried), ['https://bdl.com/test1', 'https://bdl.com/test2'])
+
+            set_native_url_resolver(r)
+            try:
+                self.assertEqual(get_item_by_native_url('https://bdl.com/test1'), 'item:https://bdl.com/test1')
+                self.assertEqual(get_item_by_native_url('https://bdl.com/test2'), None)
+                self.assertEqual(len(queried), 2)
+
+                # Prefetched results are used only once
+                self.assertEqual(get_item_by_native_url('https://bdl.com/test2'), None)
+                self.assertEqual(get_item_by_native_url('https://bdl.com/test3'), None)
+                self.assertEqual(queried[2:], ['https://bdl.com/test2', 'https://bdl.com/test3'])
+            finally:
+                set_native_url_resolver(None)
+
+            # Expired results are fetched again
+            r = NativeUrlResolver(ttl=0)
+            r.prefetch(['https://bdl.com/test1'])
+            self.assertEqual(r.get('https://bdl.com/test1'), 'item:https://bdl.com/test1')
+            self.assertEqual(queried[4:], ['https://bdl.com/test1', 'https://bdl.com/test1'])
+
+
+    def test_update_unchanged_item(self):
+        i = ApiPool.api.model.Item(
+            item_id='tst-1234',
+            real=False,
+            bdlitem=ApiPool.api.model.BDLItem(title='louis vuitton', price=1000, currency='SEK', has_ended=False),
+        )
+        model_to_item(i)
+
+        def scraped(**kwargs):
+            o = ApiPool.api.model.ScrapedBDLItem(**kwargs)
+            model_to_bdlitem(o)
+            return o
+
+        o = scraped(title='louis vuitton', price=1000, currency='SEK')
+        i.set_fingerprint(o.get_fingerprint())
+        i.save_to_db = MagicMock()
+        i.bdlitem.update = MagicMock()
+
+        table = MagicMock()
+        with patch('bdl.db.item.get_table', return_value=table) as get_table, \
+             patch('bdl.model.item.es_update_doc') as es_update_doc:
+
+            # Same announce: only date_last_check is updated
+            i.update(scraped(title='louis vuitton', price=1000, currency='SEK'))
+            self.assertEqual(i.save_to_db.call_count, 0)
+            self.assertEqual(i.bdlitem.update.call_count, 0)
+            self.assertEqual(table.update_item.call_count, 1)
+            self.assertEqual(table.update_item.call_args[1]['UpdateExpression'], 'SET #a0 = :v0')
+            self.assertEqual(table.update_item.call_args[1]['ExpressionAttributeNames'], {'#a0': 'date_last_check'})
+            self.assertEqual(table.update_item.call_args[1]['ExpressionAttributeValues'], {':v0': i.date_last_check.isoformat()})
+            self.assertEqual(es_update_doc.call_count, 1)
+            self.assertEqual(sorted(es_update_doc.call_args[0][1].keys()), ['date_last_check', 'epoch_last_check'])
+
+            # Changed announce: the item is updated and saved
+            o = scraped(title='louis vuitton', price=800, currency='SEK')
+            i.update(o)
+            self.assertEqual(i.save_to_db.call_count, 1)
+            self.assertEqual(i.bdlitem.update.call_count, 1)
+            self.assertEqual(i.get_fingerprint(), o.get_fingerprint())
+            self.assertEqual(table.update_item.call_count, 1)
+
+
+    def test_fingerprint_is_stored_but_not_in_model(self):
+        i = ApiPool.api.model.Item(item_id='tst-1234', real=False, bdlitem=ApiPool.api.model.BDLItem(title='louis vuitton', price=1000, has_ended=False))
+        model_to_item(i)
+        i.set_fingerprint('abcd')
+        self.assertTrue('fingerprint' not in ApiPool.api.model_to_json(i))
+
+        def to_model(j):
+            return ApiPool.api.json_to_model('Item', j)
+
+        table = MagicMock()
+        with patch('bdl.db.item.get_table', return_value=table), \
+             patch('bdl.db.item.get_item_cache'), \
+             patch('bdl.db.item.PersistentItem.to_model', side_effect=to_model):
+
+            store_item(i)
+            j = table.put_item.call_args[1]['Item']
+            self.assertEqual(j['fingerprint'], 'abcd')
+            self.assertEqual(j['bdlitem']['price'], '1000')
+
+            table.get_item.return_value = {'Item': j}
+            ii = load_from_table(PersistentItem, 'tst-1234')
+            self.assertEqual(ii.item_id, 'tst-1234')
+            self.assertEqual(ii.get_fingerprint(), 'abcd')
+            self.assertTrue('fingerprint' not in ApiPool.api.model_to_json(ii))
+
+
+    def test_update_item_attributes(self):
+        i = ApiPool.api.model.Item(item_id='tst-1234', real=False, count_views=3, bdlitem=ApiPool.api.model.BDLItem(has_ended=False))
+        model_to_item(i)
+
+        table = MagicMock()
+        table.update_item.return_value = {
+            'Attributes': {'count_views': Decimal(4), 'slug': 'foo'},
+        }
+        with patch('bdl.db.item.get_table', return_value=table) as get_table, \
+             patch('bdl.model.item.es_update_doc') as es_update_doc:
+            new = update_item_attributes(i, values={'slug': 'foo'}, increments={'count_views': 1})
+
+        self.assertEqual(get_table.call_args[0], ('items', ))
+        self.assertEqual(new, {'count_views': 4, 'slug': 'foo'})
+        self.assertEqual(i.count_views, 4)
+
+        kwargs = table.update_item.call_args[1]
+        self.assertEqual(kwargs['Key'], {'item_id': 'tst-1234'})
+        self.assertEqual(kwargs['UpdateExpression'], 'SET #a0 = :v0 ADD #a1 :v1')
+        self.assertEqual(kwargs['ExpressionAttributeNames'], {'#a0': 'slug', '#a1': 'count_views'})
+        self.assertEqual(kwargs['ExpressionAttributeValues'], {':v0': 'foo', ':v1': 1})
+        self.assertEqual(kwargs['ConditionExpression'], 'attribute_exists(item_id)')
+
+        self.assertEqual(es_update_doc.call_args[0][:2], ('bdlitems-test', {'count_views': 4, 'slug': 'foo'}))
+
+
+    def test_get_item_cache(self):
+        loaded = []
+
+        def load_item(item_id):
+            loaded.append(item_id)
+            if item_id == 'tst-missing':
+                raise ItemNotFoundError(item_id)
+            i = ApiPool.api.model.Item(
+                item_id=item_id,
+                index='BDL',
+                slug='slug',
+                real=False,
+                source='TEST',
+                native_url='https://bdl.com/%s' % item_id,
+                count_views=1,
+            )
+            model_to_item(i)
+            return i
+
+        def to_model(j):
+            return ApiPool.api.json_to_model('Item', j)
+
+        cache = ItemCache(maxsize=2, ttl=60)
+        with patch('bdl.db.item.get_item_cache', return_value=cache), \
+             patch('bdl.db.item.load_item', side_effect=load_item), \
+             patch('bdl.db.item.PersistentItem.to_model', side_effect=to_model):
+
+            i = get_item('tst-1')
+            i.count_views = 10
+            j = get_item('tst-1')
+            self.assertEqual(loaded, ['tst-1'])
+
+            # Cached items are copies
+            self.assertEqual(j.item_id, 'tst-1')
+            self.assertEqual(j.count_views, 1)
+            self.assertTrue(hasattr(j, 'get_subitem'))
+
+            # Missing items are not cached
+            for n in range(2):
+                with self.assertRaises(ItemNotFoundError):
+                    get_item('tst-missing')
+            self.assertEqual(loaded, ['tst-1', 'tst-missing', 'tst-missing'])
+
+            # Writes invalidate the cache
+            cache.invalidate('tst-1')
+            get_item('tst-1')
+            self.assertEqual(loaded, ['tst-1', 'tst-missing', 'tst-missing', 'tst-1'])
+
+            # Lookups that raced with a write are not cached
+            generation = cache.generation
+            cache.invalidate('tst-2')
+            cache.set(load_item('tst-2'), generation)
+            self.assertEqual(cache.get('tst-2'), None)
+
+            # Least recently used items are evicted
+            get_item('tst-3')
+            get_item('tst-4')
+            self.assertEqual(cache.get('tst-1'), None)
+            self.assertEqual(cache.get_stats()['size'], 2)
@@ -0,0 +1,73 @@
+import os
+import logging
+import threading
+from time import sleep
+from unittest import TestCase
+from unittest.mock import patch
+from pymacaron_core.swagger.apipool import ApiPool
+from bdl.formats import get_custom_formats
+from bdl.exceptions import InternalServerError
+from bdl.db.elasticsearch import get_bulk_indexer
+from bdl.api.items import process_items
+
+
+log = logging.getLogger(__name__)
+
+
+class Tests(TestCase):
+
+    def setUp(self):
+        ApiPool.add(
+            'api',
+            yaml_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apis', 'api.yaml'),
+            formats=get_custom_formats(),
+        )
+        self.maxDiff = None
+
+
+    def test_process_items_in_parallel(self):
+        lock = threading.Lock()
+        running = set()
+        overlaps = []
+        processed = []
+
+        def process_item(index, source, real, j):
+            url = j['native_url']
+            with lock:
+                if url in running:
+                    overlaps.append(url)
+                running.add(url)
+            sleep(0.01)
+            with lock:
+                running.remove(url)
+                processed.append(j['scraper_data'])
+            return ApiPool.api.model.ProcessResult(action='SKIP', item_id=j['scraper_data'])
+
+        urls = ['https://bdl.com/%s' % (i % 3) for i in range(12)]
+        jsons = [{'native_url': url, 'is_complete': False, 'scraper_data': str(i)} for i, url in enumerate(urls)]
+
+        with patch('bdl.api.items.process_item', side_effect=process_item):
+            results = process_items('BDL', 'TEST', False, *jsons)
+
+        # Results are in the same order as the scraped objects
+        self.assertEqual([r.item_id for r in results.results], [str(i) for i in range(12)])
+
+        # Objects with the same native_url were never processed at the same
+        # time, and were processed in order
+        self.assertEqual(overlaps, [])
+        for n in range(3):
+            positions = [int(p) for p in processed if int(p) % 3 == n]
+            self.assertEqual(positions, sorted(positions))
+
+
+    def test_process_items_index_errors(self):
+        def process_item(index, source, real, j):
+            # Indexing the item failed in the batch's _bulk request
+            get_bulk_indexer().errors[j['scraper_data']] = {'type': 'mapper_parsing_exception'}
+            return ApiPool.api.model.ProcessResult(action='INDEX', item_id=j['scraper_data'])
+
+        jsons = [{'native_url': 'https://bdl.com/1', 'is_complete': False, 'scraper_data': 'tst-1'}]
+
+        with patch('bdl.api.items.process_item', side_effect=process_item):
+            with self.assertRaises(InternalServerError):
+                process_items('BDL', 'TEST', False, *jsons)
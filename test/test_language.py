@@ -0,0 +1,30 @@
+import logging
+from unittest import TestCase
+from bdl.language import guess_language, identify_language_locally
+
+
+log = logging.getLogger(__name__)
+
+
+class Test(TestCase):
+
+    def test_identify_language_locally(self):
+        for text, language in [
+            ('6 st Sjuan SJUAN 3107 helkl&auml;dda i originaltyg Stolarna &auml;r 15 &aring;r gamla och i bra bruksskick. Annonsen kvar = stolarna kvar.', 'sv'),
+            ('Unik och Rymlig Mulberry axelv&auml;ska 30x40cm i svart l&auml;der och mocka.', 'sv'),
+            ('Beautiful Louis Vuitton bag in very good condition, used only a few times. Comes with the original dust bag.', 'en'),
+            ('Sac Louis Vuitton en très bon état, vendu avec sa housse. Prix ferme.', 'fr'),
+            ('Verkaufe eine Tasche von Gucci in sehr gutem Zustand, nur wenig getragen.', 'de'),
+        ]:
+            self.assertEqual(identify_language_locally(text), language, "Failed to identify %s in [%s]" % (language, text))
+
+
+    def test_identify_language_locally_inconclusive(self):
+        # Too short or ambiguous texts are left to Amazon comprehend
+        for text in [
+            '',
+            'Gucci bag',
+            'Antik karmstol',
+        ]:
+            self.assertEqual(guess_language(text), (None, 0))
+            self.assertEqual(identify_language_locally(text), None)
@@ -0,0 +1,110 @@
+import os
+import logging
+import datetime
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.parse import urlparse, parse_qs
+from pymacaron_core.swagger.apipool import ApiPool
+from bdl.formats import get_custom_formats
+from bdl.model.item import model_to_item
+from bdl.exceptions import InvalidDataError
+from bdl.api.search import doc_to_item, parse_es_date, do_search_items, decode_cursor
+from bdl.api.search import get_model_properties, trusted_json_to_model
+
+
+log = logging.getLogger(__name__)
+
+
+DOC = {
+    '_source': {
+        'item_id': 'tst-1234567890',
+        'index': 'BDL',
+        'real': False,
+        'source': 'TEST',
+        'native_url': 'https://bdl.com/test1',
+        'slug': 'louis-vuitton_1000_SEK__tst-1234567890',
+        'count_views': 12,
+        'display_priority': 1,
+        'searchable_string': 'louis vuitton a nice bag',
+        'date_created': '2018-10-01T12:00:00.123400+00:00',
+        'date_last_check': '2018-10-02T12:00:00+00:00',
+        'bdlitem': {
+            'title': 'Louis Vuitton',
+            'description': 'A nice bag',
+            'country': 'SE',
+            'language': 'en',
+            'price': 1000,
+            'price_is_fixed': False,
+            'currency': 'SEK',
+            'has_ended': True,
+            'date_ended': '2018-10-03T12:00:00+00:00',
+            'tags': ['LOUISVUITTON', 'BAGS'],
+            'picture_tags': [],
+            'native_picture_url': 'https://img.bazardelux.com/cat2.jpg',
+        },
+    },
+}
+
+
+class Tests(TestCase):
+
+    def setUp(self):
+        ApiPool.add(
+            'api',
+            yaml_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apis', 'api.yaml'),
+            formats=get_custom_formats(),
+        )
+        self.maxDiff = None
+
+
+    def test_parse_es_date(self):
+        self.assertEqual(parse_es_date('2018-10-01T12:00:00+00:00'), datetime.datetime(2018, 10, 1, 12, 0, 0, tzinfo=datetime.timezone.utc))
+        self.assertEqual(parse_es_date('2018-10-01T12:00:00.1234+00:00'), datetime.datetime(2018, 10, 1, 12, 0, 0, 123400, tzinfo=datetime.timezone.utc))
+        self.assertEqual(parse_es_date('2018-10-01T12:00:00Z'), datetime.datetime(2018, 10, 1, 12, 0, 0, tzinfo=datetime.timezone.utc))
+        # Other formats are parsed the slow way
+        self.assertEqual(parse_es_date('2018-10-01T14:00:00+02:00'), datetime.datetime(2018, 10, 1, 12, 0, 0, tzinfo=datetime.timezone.utc))
+
+
+    def test_doc_to_item(self):
+        expected = ApiPool.api.json_to_model('Item', DOC['_source'])
+        model_to_item(expected)
+
+        # Indexed documents have extra attributes
+        doc = {'_source': dict(DOC['_source'], free_search='louis vuitton', epoch_created=1538395200, uid='tst-1234567890')}
+
+        item = doc_to_item(doc)
+        self.assertEqual(str(item), str(expected))
+        self.assertEqual(item.date_created, expected.date_created)
+        self.assertEqual(item.bdlitem.date_ended, expected.bdlitem.date_ended)
+        self.assertEqual(ApiPool.api.model_to_json(item), ApiPool.api.model_to_json(expected))
+
+
+    def test_trusted_json_to_model_other_shapes(self):
+        # TopModel has no properties: it is converted by json_to_model()
+        self.assertEqual(get_model_properties('TopModel'), None)
+        with patch.object(ApiPool.api, 'json_to_model', return_value='topmodel') as json_to_model:
+            self.assertEqual(trusted_json_to_model('TopModel', {'name': 'foo'}), 'topmodel')
+        self.assertEqual(json_to_model.call_args[0], ('TopModel', {'name': 'foo'}))
+
+
+    def test_search_cursor(self):
+        hits = {'hits': {'total': 120, 'hits': [
+            dict(DOC, sort=[1538395200000, 12, 1, 'tst-1234567890']),
+        ]}}
+
+        with patch('bdl.api.search.es_search_index', return_value=hits) as search:
+            results = do_search_items(query='louis', page=0, page_size=1)
+            self.assertEqual(search.call_args[1]['search_after'], None)
+            self.assertEqual(search.call_args[1]['page'], 0)
+
+            # url_next points after the last hit
+            cursor = parse_qs(urlparse(results.url_next).query)['cursor'][0]
+            self.assertEqual(decode_cursor(cursor), [1538395200000, 12, 1, 'tst-1234567890'])
+
+            results = do_search_items(query='louis', page=1, page_size=1, cursor=cursor)
+            self.assertEqual(search.call_args[1]['search_after'], [1538395200000, 12, 1, 'tst-1234567890'])
+            self.assertIn('cursor=%s' % cursor, results.url_this)
+            self.assertIn('page=2', results.url_next)
+
+        with self.assertRaises(InvalidDataError):
+            decode_cursor('garbage')
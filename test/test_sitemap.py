@@ -0,0 +1,239 @@
+import io
+import gzip
+import json
+import logging
+import datetime
+import xml.etree.ElementTree as ET
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from bdl.io.s3 import S3UploadStream
+from bdl.api.sitemap import SitemapWriter, open_sitemap, generate_sitemap_announces
+from bdl.api.sitemap import get_month_epochs, load_manifest, save_manifest, get_items_forsale_for_period
+from bdl.api.sitemap import update_sitemap_index
+
+
+log = logging.getLogger(__name__)
+
+
+NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+class Tests(TestCase):
+
+    def test_sitemap_writer(self):
+        f = io.BytesIO()
+        smap = SitemapWriter(f)
+        smap.add('https://bazardelux.com/en/forsale/Bag_1_SEK__tst-1?a=1&b=2')
+        smap.add({
+            'url': 'https://bazardelux.com/sv/tillsalu/Väska_2_SEK__tst-2',
+            'lastmod': '2018-10-01',
+            'priority': '1.0',
+            'en': 'https://bazardelux.com/en/forsale/"Bag"_2_SEK__tst-2',
+        })
+        smap.close()
+        self.assertEqual(smap.count, 2)
+
+        root = ET.fromstring(f.getvalue())
+        urls = root.findall(NS + 'url')
+        self.assertEqual(urls[0].find(NS + 'loc').text, 'https://bazardelux.com/en/forsale/Bag_1_SEK__tst-1?a=1&b=2')
+        self.assertEqual(urls[0].find(NS + 'priority').text, '0.8')
+        self.assertEqual(urls[1].find(NS + 'loc').text, 'https://bazardelux.com/sv/tillsalu/Väska_2_SEK__tst-2')
+        self.assertEqual(urls[1].find(NS + 'lastmod').text, '2018-10-01')
+        link = urls[1].find('{http://www.w3.org/1999/xhtml}link')
+        self.assertEqual(link.get('href'), 'https://bazardelux.com/en/forsale/"Bag"_2_SEK__tst-2')
+
+
+    def test_sitemap_index_writer(self):
+        f = io.BytesIO()
+        smap = SitemapWriter(f, index=True)
+        smap.add('https://static.bazardelux.com/sitemap-bazardelux-2018-10.xml')
+        smap.add({'url': 'https://static.bazardelux.com/sitemap-bazardelux-pages.xml', 'lastmod': '2018-10-01'})
+        smap.close()
+
+        root = ET.fromstring(f.getvalue())
+        self.assertEqual(root.tag, NS + 'sitemapindex')
+        self.assertEqual([e.find(NS + 'loc').text for e in root], [
+            'https://static.bazardelux.com/sitemap-bazardelux-2018-10.xml',
+            'https://static.bazardelux.com/sitemap-bazardelux-pages.xml',
+        ])
+
+
+    def test_open_gzipped_sitemap(self):
+        stream = MagicMock()
+        data = io.BytesIO()
+        stream.write = data.write
+        with patch('bdl.api.sitemap.S3UploadStream', return_value=stream) as cls:
+            with open_sitemap('sitemap-bazardelux-2018-10.xml.gz') as smap:
+                smap.add('https://bazardelux.com/en')
+
+        self.assertEqual(cls.call_args[1]['content_type'], 'application/x-gzip')
+        self.assertEqual(stream.close.call_count, 1)
+        root = ET.fromstring(gzip.decompress(data.getvalue()))
+        self.assertEqual(root.find(NS + 'url').find(NS + 'loc').text, 'https://bazardelux.com/en')
+
+
+    def test_open_empty_sitemap(self):
+        stream = MagicMock()
+        with patch('bdl.api.sitemap.S3UploadStream', return_value=stream):
+            with open_sitemap('sitemap-bazardelux-2018-10.xml'):
+                pass
+        self.assertEqual(stream.close.call_count, 0)
+        self.assertEqual(stream.abort.call_count, 1)
+
+
+    def test_s3_upload_stream(self):
+        bucket = MagicMock()
+        parts = []
+        bucket.initiate_multipart_upload.return_value.upload_part_from_file.side_effect = lambda f, n: parts.append((n, f.read()))
+        with patch.object(S3UploadStream, 'get_bucket', return_value=bucket):
+            stream = S3UploadStream('static.bazardelux.com', 'test.xml', part_size=10)
+            for i in range(5):
+                stream.write(b'0123456')
+            stream.close()
+
+        self.assertEqual(parts, [(1, b'01234560123456'), (2, b'01234560123456'), (3, b'0123456')])
+        self.assertEqual(bucket.initiate_multipart_upload.return_value.complete_upload.call_count, 1)
+
+
+    def test_get_month_epochs(self):
+        self.assertEqual(get_month_epochs(2018, 10), (1538352000, 1541030400))
+        self.assertEqual(get_month_epochs(2018, 12), (1543622400, 1546300800))
+
+
+    def test_manifest(self):
+        data = io.BytesIO()
+        stream = MagicMock()
+        stream.write = data.write
+        entries = {
+            'tst-2': {'url': 'https://bazardelux.com/en/forsale/b__tst-2', 'lastmod': '2018-10-02', 'epoch': 1538438400},
+            'tst-1': {'url': 'https://bazardelux.com/en/forsale/a__tst-1', 'lastmod': '2018-10-01', 'epoch': 1538352000},
+        }
+        with patch('bdl.api.sitemap.S3UploadStream', return_value=stream):
+            save_manifest(2018, 10, entries)
+        lines = gzip.decompress(data.getvalue()).splitlines()
+        self.assertEqual(lines[0], b'{"epoch":1538352000,"item_id":"tst-1","lastmod":"2018-10-01","url":"https://bazardelux.com/en/forsale/a__tst-1"}')
+        self.assertEqual(len(lines), 2)
+
+        with patch('bdl.api.sitemap.get_sitemap_urls', return_value=gzip.decompress(data.getvalue())):
+            self.assertEqual(load_manifest(2018, 10), entries)
+
+
+    def test_generate_sitemap_announces_incrementally(self):
+        def item(item_id, day):
+            return {
+                'item_id': item_id,
+                'url': 'https://bazardelux.com/en/forsale/x__%s' % item_id,
+                'date_created': '2018-10-%02dT12:00:00+00:00' % day,
+                'epoch_created': 1538395200 + (day - 1) * 86400,
+            }
+
+        entries = {
+            'tst-1': {'url': 'https://bazardelux.com/en/forsale/x__tst-1', 'lastmod': '2018-10-01', 'epoch': 1538395200},
+        }
+        stream = MagicMock()
+        data = io.BytesIO()
+        stream.write = data.write
+
+        with patch('bdl.api.sitemap.load_manifest', return_value=dict(entries)), \
+             patch('bdl.api.sitemap.save_manifest') as save, \
+             patch('bdl.api.sitemap.update_sitemap_index') as update_index, \
+             patch('bdl.api.sitemap.get_items_forsale_for_period', return_value=[item('tst-1', 1), item('tst-2', 2)]) as get_items, \
+             patch('bdl.api.sitemap.get_config', return_value=MagicMock(sitemap_gzip=False, sitemap_concurrency=None)), \
+             patch('bdl.api.sitemap.S3UploadStream', return_value=stream) as stream_class:
+            count = generate_sitemap_announces(2018, 10)
+
+        self.assertEqual(count, 2)
+        # Only items created since the last run are fetched
+        self.assertEqual(get_items.call_args[1]['since'], 1538395200 - 3600)
+        self.assertEqual(sorted(save.call_args[0][2].keys()), ['tst-1', 'tst-2'])
+
+        self.assertEqual(stream_class.call_args[0][1], 'sitemap-bazardelux-2018-10-1.xml')
+        root = ET.fromstring(data.getvalue())
+        self.assertEqual([e.find(NS + 'loc').text for e in root], [
+            'https://bazardelux.com/en/forsale/x__tst-1',
+            'https://bazardelux.com/en/forsale/x__tst-2',
+        ])
+
+
+    def test_generate_sitemap_shards(self):
+        def entry(i):
+            return {'url': 'https://bazardelux.com/en/forsale/x__tst-%s' % i, 'lastmod': '2018-10-01', 'epoch': 1538395200 + i}
+
+        entries = {'tst-%s' % i: entry(i) for i in range(1, 4)}
+        new_item = dict(entry(4), item_id='tst-4', date_created='2018-10-01T00:00:00+00:00', epoch_created=1538395204)
+
+        with patch('bdl.api.sitemap.SITEMAP_MAX_URLS', 2), \
+             patch('bdl.api.sitemap.load_manifest', return_value=dict(entries)), \
+             patch('bdl.api.sitemap.save_manifest') as save, \
+             patch('bdl.api.sitemap.update_sitemap_index') as update_index, \
+             patch('bdl.api.sitemap.get_items_forsale_for_period', return_value=[new_item]), \
+             patch('bdl.api.sitemap.get_config', return_value=MagicMock(sitemap_gzip=False, sitemap_concurrency=2)), \
+             patch('bdl.api.sitemap.generate_sitemap_shard') as generate_shard:
+            count = generate_sitemap_announces(2018, 10)
+
+        self.assertEqual(count, 4)
+        self.assertEqual(len(save.call_args[0][2]), 4)
+        # Only the last shard got a new url
+        self.assertEqual(generate_shard.call_count, 1)
+        self.assertEqual(generate_shard.call_args[0][0:2], ('sitemap-bazardelux-2018-10-2.xml', ['tst-3', 'tst-4']))
+        self.assertEqual(update_index.call_args[1], {
+            'written': ['sitemap-bazardelux-2018-10-2.xml'],
+            'deleted': [],
+            'listed': ['sitemap-bazardelux-2018-10-1.xml', 'sitemap-bazardelux-2018-10-2.xml'],
+        })
+
+
+    def test_update_sitemap_index(self):
+        bucket = MagicMock()
+        bucket.get_key.return_value = None
+        bucket.list.return_value = [
+            MagicMock(last_modified='2018-09-30T12:00:00.000Z'),
+            MagicMock(last_modified='2018-10-01T12:00:00.000Z'),
+        ]
+        bucket.list.return_value[0].name = 'sitemap-bazardelux-2018-09.xml'
+        bucket.list.return_value[1].name = 'sitemap-bazardelux-2018-10.xml'
+        saved = {}
+
+        def set_contents(s):
+            saved['index'] = json.loads(s)
+
+        with patch('bdl.api.sitemap.get_s3_conn') as get_s3_conn, \
+             patch('bdl.api.sitemap.Key') as key, \
+             patch('bdl.api.sitemap.timenow', return_value=datetime.datetime(2018, 10, 2, 1, 0, 0)):
+            get_s3_conn.return_value.get_bucket.return_value = bucket
+            key.return_value.set_contents_from_string.side_effect = set_contents
+            update_sitemap_index(
+                written=['sitemap-bazardelux-2018-10-1.xml'],
+                deleted=['sitemap-bazardelux-2018-10.xml'],
+                listed=['sitemap-bazardelux-2018-09.xml', 'sitemap-bazardelux-2018-10-2.xml'],
+            )
+
+        # The bucket is only listed to bootstrap the index, by prefix
+        self.assertEqual(bucket.list.call_args[1], {'prefix': 'sitemap-bazardelux'})
+        self.assertEqual(key.return_value.key, 'sitemap-index-bazardelux.json')
+        self.assertEqual(saved['index'], {
+            'sitemap-bazardelux-2018-09.xml': '2018-09-30',
+            'sitemap-bazardelux-2018-10-1.xml': '2018-10-02',
+            'sitemap-bazardelux-2018-10-2.xml': '2018-10-02',
+        })
+
+
+    def test_get_items_forsale_for_period(self):
+        docs = [{'_source': {
+            'item_id': 'tst-1',
+            'date_created': '2018-10-02T12:00:00+00:00',
+            'epoch_created': 1538481600,
+            'bdlitem': {'title': 'Louis Vuitton bag', 'price': 1000, 'currency': 'SEK', 'language': 'sv'},
+        }}]
+        with patch('bdl.api.sitemap.get_all_docs', return_value=docs) as get_all_docs:
+            items = list(get_items_forsale_for_period(2018, 10, since=1538400000))
+
+        esquery = get_all_docs.call_args[0][0]
+        self.assertEqual(esquery['query'], {'range': {'epoch_created': {'gte': 1538400000, 'lt': 1541030400}}})
+        self.assertEqual(esquery['sort'], ['_doc'])
+        self.assertEqual(items, [{
+            'item_id': 'tst-1',
+            'url': 'https://bazardelux.com/sv/tillsalu/Louis-Vuitton-bag_1000_SEK__tst-1',
+            'date_created': '2018-10-02T12:00:00+00:00',
+            'epoch_created': 1538481600,
+        }])
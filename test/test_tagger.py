@@ -2,7 +2,8 @@ import logging
 import os
 from unittest import TestCase
 from bdl.utils import html_to_unicode
-from bdl.tagger import Keyword, KeywordList, Path, Node, Tree, get_matching_tags, get_tree
+from bdl.tagger import Keyword, KeywordList, KeywordTrie, Path, Node, Tree, get_matching_tags, get_tree
+from bdl.categories import get_categories
 
 
 log = logging.getLogger(__name__)
@@ -11,6 +12,81 @@ log = logging.getLogger(__name__)
 PATH_ETC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'etc')
 
 
+# Announce texts and the tags they should match
+TAGGED_TEXTS = [
+    [
+        'sv',
+        '&auml;kta Louis Vuitton speedy Louis Vuitton speedy 30 i perfekt skick. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
+        ['louisvuitton', 'louisvuittonspeedy', 'path:fashion:bags:louisvuitton:louisvuittonspeedy', 'path:fashion:bags', 'path:fashion:bags:louisvuitton', 'bags', 'path:fashion', 'fashion'],
+    ],
+    [
+        'en',
+        '&auml;kta Louis Vuitton speedy Louis Vuitton speedy 30 i perfekt skick. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
+        ['louisvuitton', 'louisvuittonspeedy', 'path:fashion:bags:louisvuitton:louisvuittonspeedy', 'path:fashion:bags', 'path:fashion:bags:louisvuitton', 'bags', 'path:fashion', 'fashion'],
+    ],
+    [
+        'sv',
+        'V&auml;ska Louis Vuitton Louis Vuitton i perfekt skick. Den perfekta v&auml;skan v&auml;skan. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
+        ['louisvuitton', 'path:fashion', 'path:fashion:bags', 'bags', 'path:fashion:bags:louisvuitton', 'fashion'],
+    ],
+    [
+        'sv',
+        'LV skor ** Skor, stl. 38, dam ** Nya Louis Vuitton mockasiner.',
+        ['louisvuitton', 'path:fashion', 'shoes', 'path:fashion:shoes:louisvuitton', 'path:fashion:shoes', 'fashion'],
+    ],
+    [
+        'sv',
+        'Solglas&ouml;gon Gucci Solglas&ouml;gon Gucci, ink&ouml;pta hos optiker i Nice, Frankrike. Skimrande svartbruna med m&ouml;rkt glas. Gucciemblemet i strass p&aring; skalmen. V&auml;ldigt sk&ouml;na och sitter bra p&aring; n&auml;san. Nypris 3 500 kr.',
+        ['gucci', 'path:fashion', 'path:fashion:glasses:gucci', 'glasses', 'path:fashion:glasses', 'fashion'],
+    ],
+    [
+        'sv',
+        'Solglas&ouml;gon Gucci Solglas&ouml;gon Gucci, ink&ouml;pta hos optiker i Nice, Frankrike. Skimrande svartbruna med m&ouml;rkt glas. Gucciemblemet i strass p&aring; skalmen. V&auml;ldigt sk&ouml;na och sitter bra p&aring; n&auml;san. Nypris 3 500 kr.',
+        ['gucci', 'path:fashion', 'path:fashion:glasses:gucci', 'glasses', 'path:fashion:glasses', 'fashion'],
+    ],
+    [
+        'sv',
+        'Karmstolar bord pelarbord &aring;ttakantigt bord Charmigt Gustavianskt kaklat bord',
+        ['antics', 'chair', 'furniture', 'gustavian', 'path:antics', 'path:antics:gustavian', 'path:furniture', 'path:furniture:chair', 'path:furniture:table', 'table']
+    ],
+    [
+        'sv',
+        'Rokoko karmstol svenskt tenn',
+        ['furniture', 'path:furniture', 'svenskttenn', 'chair', 'design', 'path:design', 'path:design:svenskttenn', 'path:antics', 'path:antics:rococo', 'rococo', 'path:furniture:chair', 'antics']
+    ],
+    [
+        'sv',
+        'Swedese Tree Tree kl&auml;dh&auml;ngare i svart fr&aring;n Swedese.',
+        ['path:design', 'design', 'path:design:swedese', 'swedese'],
+    ],
+    [
+        'sv',
+        '6 st Sjuan SJUAN 3107 helkl&auml;dda i originaltyg Stolarna &auml;r 15 &aring;r gamla och i bra bruksskick. Annonsen kvar = stolarna kvar. F&ouml;rst till kvarn. Tillverkade av Fritz Hansen, design Arne Jacobsen. Nypris per stol: 8120 kr Mitt pris: 9000 kr för alla 6 stolar',
+        ['arnejacobsen', 'chair', 'design', 'fritzhansen', 'furniture', 'path:design', 'path:design:arnejacobsen', 'path:design:fritzhansen', 'path:furniture', 'path:furniture:chair']
+    ],
+    [
+        'sv',
+        'Unik och Rymlig Mulberry axelv&auml;ska 30x40cm i svart l&auml;der och mocka. V&auml;skan ar numrerad. Dustbag medfoljer.',
+        ['bags', 'path:fashion', 'path:fashion:bags', 'path:fashion:bags:mulberry', 'fashion', 'mulberry'],
+    ],
+    [
+        'sv',
+        'Gutaviansk mattgrupp bord +6 stolar ,sidobird Utdragbar bord med 6stolar i gustaviansk still 1400-1000mm utan il&auml;ggsskivor sideboard sk&auml;nk i samma still och f&auml;rg L1850-DJ 435 H800 M : 5500kr Indisk soffbord300kr ek soffbord 150kr och vinst&auml;ll for 40vin flaskor 1500kr och en tavla for 100kr',
+        ['antics', 'chair', 'furniture', 'gustavian', 'path:antics', 'path:antics:gustavian', 'path:furniture', 'path:furniture:chair', 'path:furniture:table', 'table']
+    ],
+    [
+        'sv',
+        'Michael Kors klocka modell MK6188',
+        ['path:fashion:watches', 'fashion', 'path:fashion', 'path:fashion:watches:michaelkors', 'michaelkors', 'watches'],
+    ],
+    [
+        'sv',
+        'Antik karmstol',
+        ['antics', 'chair', 'furniture', 'path:antics', 'path:furniture', 'path:furniture:chair'],
+    ],
+]
+
+
 class Test(TestCase):
 
     def test_load(self):
@@ -158,80 +234,7 @@ class Test(TestCase):
 
 
     def test_get_matching_tags(self):
-        tests = [
-            [
-                'sv',
-                '&auml;kta Louis Vuitton speedy Louis Vuitton speedy 30 i perfekt skick. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
-                ['louisvuitton', 'louisvuittonspeedy', 'path:fashion:bags:louisvuitton:louisvuittonspeedy', 'path:fashion:bags', 'path:fashion:bags:louisvuitton', 'bags', 'path:fashion', 'fashion'],
-            ],
-            [
-                'en',
-                '&auml;kta Louis Vuitton speedy Louis Vuitton speedy 30 i perfekt skick. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
-                ['louisvuitton', 'louisvuittonspeedy', 'path:fashion:bags:louisvuitton:louisvuittonspeedy', 'path:fashion:bags', 'path:fashion:bags:louisvuitton', 'bags', 'path:fashion', 'fashion'],
-            ],
-            [
-                'sv',
-                'V&auml;ska Louis Vuitton Louis Vuitton i perfekt skick. Den perfekta v&auml;skan v&auml;skan. F&aring;tt den h&auml;rliga m&ouml;rkbruna f&auml;rgen. Knappt anv&auml;nd.',
-                ['louisvuitton', 'path:fashion', 'path:fashion:bags', 'bags', 'path:fashion:bags:louisvuitton', 'fashion'],
-            ],
-            [
-                'sv',
-                'LV skor ** Skor, stl. 38, dam ** Nya Louis Vuitton mockasiner.',
-                ['louisvuitton', 'path:fashion', 'shoes', 'path:fashion:shoes:louisvuitton', 'path:fashion:shoes', 'fashion'],
-            ],
-            [
-                'sv',
-                'Solglas&ouml;gon Gucci Solglas&ouml;gon Gucci, ink&ouml;pta hos optiker i Nice, Frankrike. Skimrande svartbruna med m&ouml;rkt glas. Gucciemblemet i strass p&aring; skalmen. V&auml;ldigt sk&ouml;na och sitter bra p&aring; n&auml;san. Nypris 3 500 kr.',
-                ['gucci', 'path:fashion', 'path:fashion:glasses:gucci', 'glasses', 'path:fashion:glasses', 'fashion'],
-            ],
-            [
-                'sv',
-                'Solglas&ouml;gon Gucci Solglas&ouml;gon Gucci, ink&ouml;pta hos optiker i Nice, Frankrike. Skimrande svartbruna med m&ouml;rkt glas. Gucciemblemet i strass p&aring; skalmen. V&auml;ldigt sk&ouml;na och sitter bra p&aring; n&auml;san. Nypris 3 500 kr.',
-                ['gucci', 'path:fashion', 'path:fashion:glasses:gucci', 'glasses', 'path:fashion:glasses', 'fashion'],
-            ],
-            [
-                'sv',
-                'Karmstolar bord pelarbord &aring;ttakantigt bord Charmigt Gustavianskt kaklat bord',
-                ['antics', 'chair', 'furniture', 'gustavian', 'path:antics', 'path:antics:gustavian', 'path:furniture', 'path:furniture:chair', 'path:furniture:table', 'table']
-            ],
-            [
-                'sv',
-                'Rokoko karmstol svenskt tenn',
-                ['furniture', 'path:furniture', 'svenskttenn', 'chair', 'design', 'path:design', 'path:design:svenskttenn', 'path:antics', 'path:antics:rococo', 'rococo', 'path:furniture:chair', 'antics']
-            ],
-            [
-                'sv',
-                'Swedese Tree Tree kl&auml;dh&auml;ngare i svart fr&aring;n Swedese.',
-                ['path:design', 'design', 'path:design:swedese', 'swedese'],
-            ],
-            [
-                'sv',
-                '6 st Sjuan SJUAN 3107 helkl&auml;dda i originaltyg Stolarna &auml;r 15 &aring;r gamla och i bra bruksskick. Annonsen kvar = stolarna kvar. F&ouml;rst till kvarn. Tillverkade av Fritz Hansen, design Arne Jacobsen. Nypris per stol: 8120 kr Mitt pris: 9000 kr för alla 6 stolar',
-                ['arnejacobsen', 'chair', 'design', 'fritzhansen', 'furniture', 'path:design', 'path:design:arnejacobsen', 'path:design:fritzhansen', 'path:furniture', 'path:furniture:chair']
-            ],
-            [
-                'sv',
-                'Unik och Rymlig Mulberry axelv&auml;ska 30x40cm i svart l&auml;der och mocka. V&auml;skan ar numrerad. Dustbag medfoljer.',
-                ['bags', 'path:fashion', 'path:fashion:bags', 'path:fashion:bags:mulberry', 'fashion', 'mulberry'],
-            ],
-            [
-                'sv',
-                'Gutaviansk mattgrupp bord +6 stolar ,sidobird Utdragbar bord med 6stolar i gustaviansk still 1400-1000mm utan il&auml;ggsskivor sideboard sk&auml;nk i samma still och f&auml;rg L1850-DJ 435 H800 M : 5500kr Indisk soffbord300kr ek soffbord 150kr och vinst&auml;ll for 40vin flaskor 1500kr och en tavla for 100kr',
-                ['antics', 'chair', 'furniture', 'gustavian', 'path:antics', 'path:antics:gustavian', 'path:furniture', 'path:furniture:chair', 'path:furniture:table', 'table']
-            ],
-            [
-                'sv',
-                'Michael Kors klocka modell MK6188',
-                ['path:fashion:watches', 'fashion', 'path:fashion', 'path:fashion:watches:michaelkors', 'michaelkors', 'watches'],
-            ],
-            [
-                'sv',
-                'Antik karmstol',
-                ['antics', 'chair', 'furniture', 'path:antics', 'path:furniture', 'path:furniture:chair'],
-            ],
-        ]
-
-        for lang, text, expected_tags in tests:
+        for lang, text, expected_tags in TAGGED_TEXTS:
             text = html_to_unicode(text)
             tags = get_matching_tags(text, lang)
             log.info("Text [%s..] matches tags: %s" % (text[0:10], tags))
@@ -239,3 +242,41 @@ class Test(TestCase):
             tags = set(tags)
             expected_tags = set(expected_tags)
             self.assertEqual(tags, expected_tags)
+
+
+    def test_keyword_trie(self):
+        t = KeywordTrie()
+        t.add(Keyword('louis vuitton'), 'lv')
+        t.add(Keyword('vuitton'), 'lv')
+        t.add(Keyword('sv:karmstol'), 'chair')
+        t.add(Keyword('en:chair'), 'chair')
+
+        def values(text, language):
+            return sorted(set([v for w, v in t.match(text.split(' '), language)]))
+
+        self.assertEqual(values('louis vuitton bag', 'en'), ['lv'])
+        self.assertEqual(values('a vuitton', 'sv'), ['lv'])
+        self.assertEqual(values('louis', 'en'), [])
+        self.assertEqual(values('vuittons', 'en'), [])
+        self.assertEqual(values('karmstol louis vuitton', 'sv'), ['chair', 'lv'])
+        self.assertEqual(values('karmstol', 'en'), [])
+        self.assertEqual(values('chair', 'en'), ['chair'])
+        self.assertEqual(values('', 'en'), [])
+
+        # Both keywords matching 'louis vuitton' are returned
+        matches = t.match(['louis', 'vuitton'], 'en')
+        self.assertEqual(sorted([w.word for w, v in matches]), ['louis vuitton', 'vuitton'])
+
+
+    def test_category_matching_words(self):
+        # The whitelist index must return the same words, in the same order,
+        # as matching every whitelist keyword one by one
+        for lang, text, expected_tags in TAGGED_TEXTS:
+            for s in (text, html_to_unicode(text), ' %s ' % html_to_unicode(text).lower()):
+                for cat in get_categories():
+                    expected = [w.word.lower() for w in cat.whitelist.keywords if w.match(s.lower(), lang)]
+                    self.assertEqual(cat.get_matching_words(s, lang), expected)
+
+        cat = [c for c in get_categories() if c.name == 'art'][0]
+        self.assertTrue(len(cat.get_matching_words('tavla av carl larsson', 'sv')) > 0)
+        self.assertEqual(cat.get_matching_words('', 'sv'), [])
@@ -0,0 +1,114 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from bdl.db.views import ViewCounter, PersistentArchivedItem
+
+
+log = logging.getLogger(__name__)
+
+
+def mock_item(item_id, count_views=0):
+    item = MagicMock()
+    item.item_id = item_id
+    item.count_views = count_views
+    return item
+
+
+class Tests(TestCase):
+
+    def test_view_counter(self):
+        flushed = []
+        failing = set(['tst-c'])
+
+        def update_item_attributes(item, increments=None):
+            if item.item_id in failing:
+                raise Exception('Throttled')
+            flushed.append((item.item_id, increments['count_views']))
+
+        a = mock_item('tst-a', 3)
+        b = mock_item('tst-b')
+        c = mock_item('tst-c')
+
+        with patch('bdl.db.views.update_item_attributes', side_effect=update_item_attributes), \
+             patch('bdl.db.views.ESBulkIndexer'):
+            counter = ViewCounter(max_seconds=60, max_views=1000)
+            try:
+                counter.add(a)
+                counter.add(b)
+                counter.add(c)
+
+                # count_views is incremented right away, including with the
+                # views of the item not stored yet
+                self.assertEqual(a.count_views, 4)
+                a = mock_item('tst-a', 3)
+                counter.add(a)
+                self.assertEqual(a.count_views, 5)
+                self.assertEqual(counter.get_stats()['pending_views'], 4)
+                self.assertEqual(flushed, [])
+
+                # Views are aggregated per item
+                counter.flush()
+                self.assertEqual(sorted(flushed), [('tst-a', 2), ('tst-b', 1)])
+
+                # Failed views are retried at the next flush
+                stats = counter.get_stats()
+                self.assertEqual(stats['pending_views'], 1)
+                self.assertEqual(stats['pending_items'], 1)
+                self.assertEqual(stats['flushes'], 1)
+                self.assertEqual(stats['flushed_views'], 3)
+                self.assertTrue(stats['last_flush_seconds'] is not None)
+
+                failing.clear()
+                counter.add(b)
+            finally:
+                # Stopping drains the pending views
+                counter.stop()
+
+            self.assertEqual(sorted(flushed), [('tst-a', 2), ('tst-b', 1), ('tst-b', 1), ('tst-c', 1)])
+            self.assertEqual(counter.get_stats()['pending_views'], 0)
+
+
+    def test_view_counter_flush_on_count(self):
+        with patch('bdl.db.views.update_item_attributes') as update_item_attributes, \
+             patch('bdl.db.views.ESBulkIndexer'):
+            counter = ViewCounter(max_seconds=60, max_views=3)
+            try:
+                for i in range(3):
+                    counter.add(mock_item('tst-%s' % i))
+
+                # The flushing thread wakes up as soon as max_views are pending
+                for i in range(100):
+                    if update_item_attributes.call_count == 3:
+                        break
+                    counter.thread.join(0.01)
+                self.assertEqual(update_item_attributes.call_count, 3)
+            finally:
+                counter.stop()
+
+
+    def test_view_counter_flush_item(self):
+        updated = []
+
+        def update_item_attributes(item, increments=None, persistent_class=None):
+            updated.append(persistent_class)
+            if not persistent_class:
+                # The item was archived meanwhile
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+            item.count_views = 4
+
+        with patch('bdl.db.views.update_item_attributes', side_effect=update_item_attributes), \
+             patch('bdl.db.views.ESBulkIndexer'):
+            counter = ViewCounter(max_seconds=60, max_views=1000)
+            try:
+                counter.add(mock_item('tst-a', 2))
+                counter.add(mock_item('tst-a', 2))
+
+                # Pending views are stored in the archive, and set on the item
+                a = mock_item('tst-a', 2)
+                counter.flush_item(a)
+                self.assertEqual(a.count_views, 4)
+                self.assertEqual(updated, [None, PersistentArchivedItem])
+                self.assertEqual(counter.get_stats()['pending_views'], 0)
+            finally:
+                counter.stop()
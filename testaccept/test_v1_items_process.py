@@ -2,6 +2,7 @@ import os
 import imp
 import logging
 from bdl.db.item import get_item_by_native_url
+from bdl.db.item import PersistentItem
 
 
 common = imp.load_source('common', os.path.join(os.path.dirname(__file__), 'common.py'))
@@ -254,6 +255,10 @@ class Tests(common.BDLTests):
             },
         })
 
+        # The fingerprint of the announce is stored in DynamoDB only
+        fingerprint = PersistentItem.get_table().get_item(Key={'item_id': item_id})['Item']['fingerprint']
+        self.assertTrue(fingerprint)
+
         # Send the announce again, but change price. Check that the item got updated
         r = self.process_complete_announce(
             native_url=url,
@@ -278,6 +283,7 @@ class Tests(common.BDLTests):
         jj = self.get_item_or_timeout(native_url=url)
         j['bdlitem']['price'] = 800
         j['slug'] = 'louis-vuitton_800_SEK__%s' % j['item_id']
+        self.assertNotEqual(PersistentItem.get_table().get_item(Key={'item_id': item_id})['Item']['fingerprint'], fingerprint)
 
         self.assertTrue(jj['date_last_check'] > j['date_last_check'])
         j['date_last_check'] = jj['date_last_check']
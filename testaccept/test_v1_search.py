@@ -1,6 +1,9 @@
 import os
 import imp
+import json
+import base64
 import logging
+from urllib.parse import urlparse, parse_qs
 
 
 common = imp.load_source('common', os.path.join(os.path.dirname(__file__), 'common.py'))
@@ -11,6 +14,23 @@ log = logging.getLogger(__name__)
 
 class Tests(common.BDLTests):
 
+    def assertUrlNext(self, j, page, page_size):
+        """Check the url of the next page of results, whose cursor points after
+        the last item returned"""
+        url = urlparse(j['url_next'])
+        self.assertEqual(url.path, '/v1/search')
+        q = parse_qs(url.query)
+        self.assertEqual(sorted(q.keys()), ['cursor', 'location', 'page', 'page_size'])
+        self.assertEqual(q['page'], [str(page)])
+        self.assertEqual(q['page_size'], [str(page_size)])
+        self.assertEqual(q['location'], ['ALL'])
+
+        cursor = q['cursor'][0]
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf8'))
+        self.assertEqual(len(values), 4)
+        self.assertEqual(values[-1], j['items'][-1]['item_id'])
+
+
     def test_v1_search__auth_required(self):
         self.assertGetReturnError(
             'v1/search',
@@ -34,9 +54,10 @@ class Tests(common.BDLTests):
                 "items": j['items'],
                 "location": "ALL",
                 "url_this": "/v1/search?page=0&page_size=50&location=ALL",
-                "url_next": "/v1/search?page=1&page_size=50&location=ALL",
+                "url_next": j['url_next'],
             }
         )
+        self.assertUrlNext(j, 1, 50)
 
         for i in j['items']:
             self.assertIsItem(i, index='BDL')
@@ -59,9 +80,10 @@ class Tests(common.BDLTests):
                 "items": j['items'],
                 "location": "ALL",
                 "url_this": "/v1/search?page=1&page_size=10&location=ALL",
-                "url_next": "/v1/search?page=2&page_size=10&location=ALL",
+                "url_next": j['url_next'],
             }
         )
+        self.assertUrlNext(j, 2, 10)
 
 
     def test_v1_search__bdl__live__no_hits(self):